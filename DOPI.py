@@ -17,25 +17,54 @@ Requirements:
 - Zusätzliche Python-Bibliotheken (siehe requirements.txt)
 """
 
-import shutil
-import json
 from customtkinter import *
 from CTkMessagebox import CTkMessagebox
-from PIL import Image
-import pytesseract
-from pypdf import PdfReader
 import sqlite3
+import threading
 import tkinter as tk
 from tkinter import filedialog, ttk
 import ctypes
-
-# Reference to the local Tesseract directory
-pytesseract.pytesseract.tesseract_cmd = os.path.join(os.path.dirname(__file__), 'tesseract', 'tesseract.exe')
+from dopi.cache import ExtractionCache, file_hash
+from dopi.changes import ChangeMonitor
+from dopi.config import load_config, save_config
+from dopi.preprocess import profile_name
+from dopi.paging import PagedTreeview, LazyText, text_indices
+from dopi.database import Database, iso_date
+from dopi.extraction import iter_pages, extraction_settings
+from dopi.ingest import ingest_folder
+from dopi.jobs import BackgroundJob
+from dopi.metrics import enabled, stats, timer
+from dopi.preview import PreviewCache, PREVIEW_SIZE
+from dopi.search import SearchEngine, FIRST_LIST_KEY, FIRST_PAGE, NO_FILTERS, match_ranges
+from dopi.storage import archive_file, release_blob, stored_path
 
 # Global variables
 file = ""
 search = ""
+filters = NO_FILTERS
+keyword_labels = {}
+keyword_counts = []
+keyword_key = None
+keyword_job = None
 target_folder = ""
+file_digest = None
+scan_job = None
+scan_note = ""
+scan_pages = []
+# Refresh interval of the statistics tab in ms
+STATS_INTERVAL = 2000
+# Interval in ms of the check for changes by other instances sharing the storage folder
+CHANGE_INTERVAL = 1000
+# Labels of the OCR profiles in the sidebar
+PROFILE_LABELS = {"Schnell": "fast", "Normal": "balanced", "Genau": "accurate"}
+# Keyword filter of the overview
+ALL_KEYWORDS = "Alle Schlagworte"
+MAX_KEYWORDS = 50
+# Parts of text (dopi.paging.TEXT_CHUNK) the popup loads at most to find the next hit
+HIT_SEARCH_CHUNKS = 5
+database = Database()
+extraction_cache = ExtractionCache(database)
+change_monitor = ChangeMonitor(database)
 
 try:
     ctypes.windll.shcore.SetProcessDpiAwareness(2)  # Activates system-aware DPI
@@ -46,20 +75,18 @@ except Exception:
 # Loading and saving the path in the configuration file
 def load_path():
     global target_folder
-    if os.path.exists("config.json"):
-        with open("config.json", "r") as jsonfile:
-            data = json.load(jsonfile)
-            target_folder = data.get("Storage path", "")
+    target_folder = load_config().get("Storage path", "")
+    database.folder = target_folder
     return target_folder
 
 
 def save_path():
     path = filedialog.askdirectory()
     if path:
-        with open("config.json", "w") as jsonfile:
-            json.dump({"Storage path": path}, jsonfile)
+        save_config(**{"Storage path": path})
         global target_folder
         target_folder = path
+        database.folder = path
         path_entry.configure(state="normal")
         path_entry.delete("0", END)
         path_entry.insert("0", path)
@@ -69,27 +96,10 @@ def save_path():
         message.delete(1.0, END)
         message.insert(END, message_text)
         message.configure(text_color="#75F94D", state="disabled")
-        create_database()
+        database.create()
         read_data()
 
 
-# Initialisation of the database
-def create_database():
-    connection = sqlite3.connect(os.path.join(target_folder, "DOPI.db"))
-    cursor = connection.cursor()
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS documents (
-        id INTEGER PRIMARY KEY,
-        name TEXT UNIQUE,
-        keyword1 TEXT,
-        keyword2 TEXT,
-        date TEXT, 
-        content TEXT)
-    ''')
-    connection.commit()
-    connection.close()
-
-
 def first_path():
     while not target_folder:
         folder_selection = CTkMessagebox(title="Pfad wählen", message="Vor der ersten Benutzung muss ein Speicherpfad "
@@ -101,12 +111,9 @@ def first_path():
         save_path()
 
 
-# Insert and update data
-def insert_data(name, keyword1, keyword2, date, content, segment_archiv):
-    connection = sqlite3.connect(os.path.join(target_folder, "DOPI.db"))
-    cursor = connection.cursor()
-    cursor.execute('SELECT * FROM documents WHERE name = ?', (name,))
-    existing_data = cursor.fetchone()
+# Insert and update data, pages is the list of the scanned page texts
+def insert_data(name, keyword1, keyword2, date, pages, segment_archiv):
+    existing_data = database.find_by_name(name)
 
     # Check whether the file already exists
     if existing_data:
@@ -114,34 +121,39 @@ def insert_data(name, keyword1, keyword2, date, content, segment_archiv):
                                f"Möchten Sie die Inhalte ersetzen?", option_1="Nein", option_2="Ja", width=450,
                                wraplength=370, button_width=100, cancel_button="none")
         if result.get() == "Nein":
-            connection.close()
             return
 
-    # Data is only overwritten if the copy process was successful
-    copied = archive(file, target_folder, segment_archiv)
+    # Date filters and the date order need a valid date
+    if date.strip() and not iso_date(date):
+        result = CTkMessagebox(title="Ungültiges Datum", message=f"'{date}' ist kein gültiges Datum (TT.MM.JJJJ). "
+                               f"Das Dokument erscheint dann nicht in Datumsfiltern.\nTrotzdem speichern?",
+                               option_1="Nein", option_2="Ja", width=450, wraplength=370, button_width=100,
+                               cancel_button="none")
+        if result.get() == "Nein":
+            return
+
+    # Data is only overwritten if the copy process was successful. The blob is claimed until the document is saved.
+    old_blob = database.blob(name)
+    claims = []
+    copied, blob, sha256 = archive(file, target_folder, segment_archiv,
+                                   lambda blob: claims.append(database.claim_blob(blob)))
     if copied:
-        # If the file already exists, the data is overwritten (Upsert (Update or Insert))
-        cursor.execute('''
-                INSERT INTO documents (name, keyword1, keyword2, date, content)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(name) DO UPDATE SET 
-                    keyword1 = excluded.keyword1,
-                    keyword2 = excluded.keyword2,
-                    date = excluded.date,
-                    content = excluded.content
-                ''', (name, keyword1, keyword2, date, content))
-        connection.commit()
-        connection.close()
+        # If the file already exists, the data is overwritten. The checksum is the one of the archived file, the
+        # file may have changed since it was read.
+        database.upsert(name, keyword1, keyword2, date, pages, sha256, blob, claims)
+        if old_blob != blob:
+            release_blob(database, old_blob)
         read_data()
         search_document(search_field_entry)
     else:
+        database.drop_claims(claims)
         message_text = "\nDaten wurden nicht überschrieben!"
         message.insert(END, message_text)
         message.configure(text_color="#EB3324")
         message.configure(state="disabled")
 
 
-# Open and scan image
+# Open image, the scan runs in the background
 def open_image():
     global file
     file = filedialog.askopenfilename(filetypes=[("Image files", "*.png;*.jpg")])
@@ -151,34 +163,28 @@ def open_image():
         name_entry.delete("0", END)
         name_entry.insert("0", image_file_name)
         name_entry.configure(state="disabled")
-        text = pytesseract.image_to_string(Image.open(file))
-        return text
+        return file
 
 
-# Open PDF and extract text
+# Open PDF, the text is extracted in the background
 def open_pdf():
     global file
     file = filedialog.askopenfilename(filetypes=[("PDF files", "*.pdf")])
     if file:
-        # PDF mit PyPDF öffnen
-        reader = PdfReader(file)
         pdf_file_name = os.path.basename(file)
         name_entry.configure(state="normal")
         name_entry.delete("0", END)
         name_entry.insert("0", pdf_file_name)
         name_entry.configure(state="disabled")
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() + ("\n"*2)
-        return text
+        return file
 
 
-# Archive file
-def archive(source, target_folder, segment_archiv):
-    copied = False
+# Archive file, returns (copied, blob, sha256)
+def archive(source, target_folder, segment_archiv, claim=None):
+    copied, blob, sha256 = False, None, None
     if segment_archiv == "Copy":
         try:
-            shutil.copy(source, target_folder)
+            blob, sha256 = archive_file(source, target_folder, "Copy", file_digest, claim=claim)
             message.configure(state="normal")
             message_text = f"Datei erfolgreich kopiert"
             message.delete(1.0, END)
@@ -190,15 +196,10 @@ def archive(source, target_folder, segment_archiv):
             message_text = f"Fehler beim Kopieren der Datei: {e}"
             message.delete(1.0, END)
             message.insert(END, message_text)
-        return copied
+        return copied, blob, sha256
     else:
         try:
-            # Extract file name from the source path and create complete target path
-            filename = os.path.basename(source)
-            target_path = os.path.join(target_folder, filename)
-            if os.path.exists(target_path):
-                os.remove(target_path)
-            shutil.move(source, target_folder)
+            blob, sha256 = archive_file(source, target_folder, "Move", claim=claim)
             message.configure(state="normal")
             message_text = f"Datei erfolgreich verschoben"
             message.delete(1.0, END)
@@ -210,7 +211,7 @@ def archive(source, target_folder, segment_archiv):
             message_text = f"Fehler beim verschieben der Datei: {e}"
             message.delete(1.0, END)
             message.insert(END, message_text)
-        return copied
+        return copied, blob, sha256
 
 
 # Event for Segmented Button
@@ -218,19 +219,125 @@ def segment_event(file_type):
     scan_button.configure(command=handle_pdf_scan if file_type == "PDF" else handle_img_scan)
 
 
+# Event for the OCR profile, used by the next scans and imports
+def profile_event(label):
+    save_config(**{"OCR profile": PROFILE_LABELS[label]})
+
+
 # Event for Image and PDF scanning
 def handle_img_scan():
-    text = open_image()
-    if text:
-        content_textbox.delete(1.0, END)
-        content_textbox.insert(END, text)
+    path = open_image()
+    if path:
+        start_scan(path)
 
 
 def handle_pdf_scan():
-    text = open_pdf()
-    if text:
-        content_textbox.delete(1.0, END)
-        content_textbox.insert(END, text)
+    path = open_pdf()
+    if path:
+        start_scan(path)
+
+
+# Scan the pages on a worker thread, the text of every finished page is shown immediately
+def start_scan(path):
+    global scan_job, file_digest, scan_note, scan_pages
+    file_digest = None
+    scan_note = ""
+    scan_pages = []
+    content_preview.clear()
+    scan_button.configure(state="disabled")
+    insert_button.configure(state="disabled")
+    cancel_button.configure(state="normal")
+    show_scan_message("Dokument wird gescannt...", "#DCE4EE")
+    scan_job = BackgroundJob(root, lambda: scan_file(path), show_scan_item, finish_scan)
+
+
+# Runs on the worker thread: hash the file, look for a document with the same content and extract the pages.
+# Files that were extracted before are taken from the extraction cache.
+def scan_file(path):
+    digest = file_hash(path)
+    yield "hash", digest, database.find_by_hash(digest)
+    for page in extraction_cache.pages(digest, extraction_settings(path), lambda: iter_pages(path)):
+        yield "page", page
+
+
+def show_scan_item(item):
+    global file_digest, scan_note
+    if item[0] == "hash":
+        _, file_digest, duplicate = item
+        if duplicate is not None and duplicate != os.path.basename(file):
+            scan_note = f"\nDuplikat von '{duplicate}'"
+        show_scan_message("Dokument wird gescannt..." + scan_note, "#DCE4EE")
+    else:
+        page_no, page_count, text = item[1]
+        # All pages are saved, the content box only shows the beginning and more while scrolling
+        scan_pages.append(text)
+        content_preview.append(text)
+        show_scan_message(f"Seite {page_no} von {page_count} gescannt" + scan_note, "#DCE4EE")
+
+
+# Page texts to save: as scanned or, if the user corrected the content box, as shown there
+def scanned_pages():
+    if content_preview.edited:
+        return content_preview.page_texts()
+    return list(scan_pages)
+
+
+def cancel_scan():
+    if scan_job is not None:
+        scan_job.cancel()
+        cancel_button.configure(state="disabled")
+
+
+def finish_scan(cancelled, error):
+    global scan_job
+    scan_job = None
+    scan_button.configure(state="normal")
+    insert_button.configure(state="normal")
+    cancel_button.configure(state="disabled")
+    if error is not None:
+        show_scan_message(f"Fehler beim Scannen der Datei: {error}", "#EB3324")
+    elif cancelled:
+        show_scan_message("Scan abgebrochen, der Inhalt ist unvollständig", "#EB3324")
+    else:
+        show_scan_message("Scan abgeschlossen" + scan_note, "#75F94D")
+
+
+def show_scan_message(message_text, color):
+    message.configure(state="normal")
+    message.delete(1.0, END)
+    message.insert(END, message_text)
+    message.configure(text_color=color, state="disabled")
+
+
+# Import all files of a folder in the background
+def import_folder():
+    folder = filedialog.askdirectory()
+    if folder:
+        import_button.configure(state="disabled")
+        threading.Thread(target=run_import, args=(folder, segment_archiv.get()), daemon=True).start()
+
+
+def run_import(folder, mode):
+    def progress(done, total, errors, rate):
+        root.after(0, show_scan_message, f"{done} von {total} Dateien verarbeitet ({rate:.1f} Dateien/s)\n"
+                                         f"{errors} Fehler", "#DCE4EE")
+    try:
+        result = ingest_folder(database, folder, mode, progress=progress)
+    except Exception as e:
+        root.after(0, finish_import, f"Fehler beim Importieren: {e}", "#EB3324")
+        return
+    rate = result.total / result.seconds if result.seconds else 0
+    message_text = f"{result.imported} von {result.total} Dateien importiert ({rate:.1f} Dateien/s)"
+    for path, error in result.errors:
+        message_text += f"\nFehler: {os.path.basename(path)}: {error}"
+    root.after(0, finish_import, message_text, "#EB3324" if result.errors else "#75F94D")
+
+
+def finish_import(message_text, color):
+    show_scan_message(message_text, color)
+    import_button.configure(state="normal")
+    read_data()
+    search_document(search_field_entry)
 
 
 # Empty keyword fields
@@ -240,90 +347,181 @@ def clear():
     date_entry.delete("0", END)
 
 
-# Read out data and insert into the treeview
+# Read out data and insert into the treeview (further pages are loaded while scrolling)
 def read_data():
-    connection = sqlite3.connect(os.path.join(target_folder, "DOPI.db"))
-    cursor = connection.cursor()
     try:
-        cursor.execute("SELECT * FROM documents ORDER BY id DESC")
-    except:
+        with timer("gui.read_data"):
+            update_keywords()
+            tree_pages.load(lambda key, limit, current=filters: database.list_page(key, limit, current),
+                            FIRST_LIST_KEY)
+    except sqlite3.Error:
+        tree_pages.clear()
         new_path = False
         while not new_path:
             change_path = CTkMessagebox(title="Keine Datenbank vorhanden", message="Im Speicherpfad befindet sich "
                                         "keine Datenbank mehr.\nBitte bestätigen Sie den Pfad, um eine neue Datenbank "
                                         "zu erstellen oder wählen Sie einen anderen Pfad.\nVorhandene Dateien werden "
-                                        "nicht automatisch in die neue Datenbank übernommen!", option_1="Beenden",
+                                        "nicht automatisch in die neue Datenbank übernommen! Mit 'python -m dopi "
+                                        "import --from-storage' werden sie in den Katalog aufgenommen.",
+                                        option_1="Beenden",
                                         option_2="Pfad wählen", width=600, wraplength=500, button_width=100,
                                         icon="warning", cancel_button="none")
             if change_path.get() == "Beenden":
                 exit()
             save_path()
             new_path = True
-    data = cursor.fetchall()
-    # Delete previous data in the treeview
-    for row in tree.get_children():
-        tree.delete(row)
-    count = 0
-    for row_data in data:
-        single_row = []
-        for column_data in row_data:
-            column_data = str(column_data).replace("\n", "")[0:300]
-            single_row.append(column_data)
-        if count % 2 == 0:
-            tree.insert("", "end", values=single_row, tags=("evenrow", ))
-        else:
-            tree.insert("", "end", values=single_row, tags=("oddrow",))
-        count += 1
-    connection.close()
 
 
-# Search document
+# Search document (the query runs in the background, see show_search_results)
 def search_document(event):
     global search
     search = search_field_entry.get().lower()
     if search:
-        # Separate the search terms with spaces
-        search_terms = search.split()
-        connection = sqlite3.connect(os.path.join(target_folder, "DOPI.db"))
-        cursor = connection.cursor()
-        # Create dynamic SQL query for multiple search words
-        query = "SELECT * FROM documents WHERE " + " AND ".join(
-            ["(LOWER(name) LIKE ? OR LOWER(keyword1) LIKE ? OR LOWER(keyword2) LIKE ? OR LOWER(date) "
-             "LIKE ? OR LOWER(content) LIKE ?)"] * len(search_terms)
-        ) + " ORDER BY id DESC"
-        search_patterns = []
-        for term in search_terms:
-            search_patterns.extend([f"%{term}%"] * 5)
-        # Execute SQL query and retrieve results
-        cursor.execute(query, search_patterns)
-        data = cursor.fetchall()
-        for row in tree.get_children():
-            tree.delete(row)
-        count = 0
-        for row_data in data:
-            single_row = []
-            for column_data in row_data:
-                # Write content in one line and shorten
-                column_data = str(column_data).replace("\n", "")[0:300]
-                single_row.append(column_data)
-            if count % 2 == 0:
-                tree.insert("", "end", values=single_row, tags=("evenrow",))
-            else:
-                tree.insert("", "end", values=single_row, tags=("oddrow",))
-            count += 1
-        connection.close()
+        search_engine.submit(search, filters)
     else:
+        search_engine.cancel()
         read_data()
 
 
-# Show popup for complete content (Double-Click Event)
-def show_popup(content, x, y):
+# Show the first page of the latest search in the treeview
+def show_search_results(search_terms, search_filters, page):
+    with timer("gui.search_results"):
+        # Further pages are read by the search worker, the Tk thread never runs the full-text query
+        tree_pages.load(lambda key, limit, deliver: search_engine.fetch_page(search_terms, search_filters, key, limit,
+                                                                             deliver),
+                        FIRST_PAGE, page, background=True)
+
+
+# Read the filter fields, invalid dates are marked and ignored
+def read_filters():
+    dates = []
+    for entry in (date_from_entry, date_to_entry):
+        value = iso_date(entry.get())
+        entry.configure(border_color="#EB3324" if entry.get().strip() and not value else filter_border_color)
+        dates.append(value or None)
+    return filters._replace(date_from=dates[0], date_to=dates[1], keyword=keyword_labels.get(keyword_menu.get()))
+
+
+# Apply the filters (date fields on Enter or when leaving them, keyword on selection)
+def apply_filters(event=None):
+    global filters
+    new_filters = read_filters()
+    if new_filters != filters:
+        filters = new_filters
+        if search:
+            # Without search terms read_data refreshes the keywords
+            update_keywords()
+        search_document(search_field_entry)
+
+
+def reset_filters():
+    date_from_entry.delete("0", END)
+    date_to_entry.delete("0", END)
+    keyword_menu.set(ALL_KEYWORDS)
+    apply_filters()
+
+
+# Sort the overview without search terms by the document date or by the order of saving (click on "Datum")
+def sort_by_date():
+    global filters
+    filters = filters._replace(order="id" if filters.order == "date" else "date")
+    tree.heading(4, text="Datum ▼" if filters.order == "date" else "Datum")
+    search_document(search_field_entry)
+
+
+# Keywords with their number of documents in the selected date range. Counting scans the keyword indexes, so it
+# runs on a worker thread and only after the documents or the date range changed.
+def update_keywords():
+    global keyword_key, keyword_job
+    # The cache generation only changes when documents are written or changed by another program, not when a worker
+    # thread (like this job) connects, so the counts are only taken again after a data change
+    key = (filters.date_from, filters.date_to, database.path, database.query_cache.generation)
+    if key == keyword_key:
+        show_keywords()
+        return
+    keyword_key = key
+    if keyword_job is not None:
+        keyword_job.cancel()
+    current = filters
+    keyword_job = BackgroundJob(root, lambda: [database.keyword_counts(current)[:MAX_KEYWORDS]], show_keyword_counts,
+                                finish_keywords)
+
+
+def show_keyword_counts(counts):
+    global keyword_counts
+    keyword_counts = counts
+    show_keywords()
+
+
+def finish_keywords(cancelled, error):
+    global keyword_key
+    if error is not None:
+        # Counted again with the next update
+        keyword_key = None
+
+
+def show_keywords():
+    global keyword_labels
+    keyword_labels = {ALL_KEYWORDS: None}
+    keyword_labels.update({f"{keyword} ({number})": keyword for keyword, number in keyword_counts})
+    selected = next((label for label, keyword in keyword_labels.items() if keyword == filters.keyword), None)
+    if selected is None:
+        # The selected keyword has no documents in the date range
+        selected = f"{filters.keyword} (0)"
+        keyword_labels[selected] = filters.keyword
+    keyword_menu.configure(values=list(keyword_labels))
+    keyword_menu.set(selected)
+
+
+# Refresh the rows changed by other instances or by a running import, only the changed rows are read
+def poll_changes():
+    try:
+        document_ids = change_monitor.poll()
+    except sqlite3.Error:
+        document_ids = set()
+    if document_ids is None:
+        search_document(search_field_entry)
+    elif document_ids:
+        refresh_rows(document_ids)
+    root.after(CHANGE_INTERVAL, poll_changes)
+
+
+def refresh_rows(document_ids):
+    rows = {row[0]: row for row in database.list_rows(document_ids)}
+    tree_pages.update_rows({document_id: rows.get(document_id) for document_id in document_ids})
+    update_keywords()
+    # New documents have the largest ids: at the top of the list newest first, at an unknown position otherwise
+    newest = tree_pages.max_id()
+    added = sorted((row for row in rows.values() if row[0] > newest), reverse=True)
+    if added:
+        if search or filters != NO_FILTERS:
+            search_document(search_field_entry)
+        else:
+            tree_pages.prepend(added)
+
+
+# Statistics tab: latencies of the measured stages and the counters, refreshed while the tab is shown
+def show_stats():
+    if tabview.get() == "Statistik":
+        rows, counters = stats()
+        stats_tree.delete(*stats_tree.get_children())
+        for stage, number, p50, p95, per_minute in rows:
+            stats_tree.insert("", "end", values=(stage, number, f"{p50:.1f}", f"{p95:.1f}", f"{per_minute:.0f}"),
+                              tags=("evenrow" if len(stats_tree.get_children()) % 2 == 0 else "oddrow",))
+        for name, value in sorted(counters.items()):
+            stats_tree.insert("", "end", values=(name, value, "", "", ""),
+                              tags=("evenrow" if len(stats_tree.get_children()) % 2 == 0 else "oddrow",))
+    root.after(STATS_INTERVAL, show_stats)
+
+
+# Show popup for complete content (Double-Click Event), the pages are loaded while scrolling
+def show_popup(content, document_id, x, y):
     popup = CTkToplevel(root)
     popup.overrideredirect(True)  # Remove window frames
     popup.geometry(f"{int(x)}+{int(y)}")
     popup.focus_force()  # Sets the focus on the pop-up
     # List of column names (without ID)
-    column_names = ["Name", "Schlagwort 1", "Schlagwort 2", "Datum", "Inhalt"]
+    column_names = ["Name", "Schlagwort 1", "Schlagwort 2", "Datum"]
     # Formatted content: Column name + cell value for each row
     formatted_content = ""
     for row in content:
@@ -331,39 +529,97 @@ def show_popup(content, x, y):
             # Add column name and value
             if value is not None:
                 formatted_content += f"{column_names[i]}: {value}\n"
-            # Paragraph after Column 3 (Date)
-            if i == 3:
-                formatted_content += "\n"
+        # Paragraph after Column 3 (Date)
+        formatted_content += "\nInhalt: "
 
     text_box = tk.Text(popup, width=70, height=23, wrap="word", font=("Arial", 13), background="#2B2B2B",
                        foreground="#DCE4EE", border="0")
+    text_box.tag_config("highlight", background="#144870", foreground="#DCE4EE", font=("Arial", 13, "bold"))
+    text_box.tag_config("current_hit", background="#1F6AA5")
+    text_box.tag_raise("current_hit")
+    search_terms = search.split()
     scrollbar = CTkScrollbar(popup, command=text_box.yview, fg_color="#2B2B2B")
+    popup_text = LazyText(text_box, scrollbar.set, read_only=True,
+                          on_append=lambda start, text: highlight_text(text_box, start, text, search_terms))
+
+    # Navigation between the hits, more text is loaded when the next hit is not shown yet
+    if search_terms:
+        navigation_frame = CTkFrame(popup, fg_color="#2B2B2B")
+        navigation_frame.pack(side="bottom", fill="x")
+        hit_label = CTkLabel(navigation_frame, text="")
+        CTkButton(navigation_frame, text="Vorheriger Treffer", width=140, corner_radius=32,
+                  command=lambda: jump_to_hit(text_box, popup_text, hit_label, False)).pack(side="left", padx=10,
+                                                                                              pady=5)
+        CTkButton(navigation_frame, text="Nächster Treffer", width=140, corner_radius=32,
+                  command=lambda: jump_to_hit(text_box, popup_text, hit_label)).pack(side="left", pady=5)
+        hit_label.pack(side="left", padx=10)
+        popup.bind("<F3>", lambda event: jump_to_hit(text_box, popup_text, hit_label))
+        popup.bind("<Shift-F3>", lambda event: jump_to_hit(text_box, popup_text, hit_label, False))
+
+    # Preview of the file next to the text, rendered in the background (dopi.preview)
+    preview_label = CTkLabel(popup, text="Vorschau wird geladen...", width=PREVIEW_SIZE[0])
+    preview_label.pack(side="left", fill="y", padx=10, pady=10)
+    details = database.file_details(document_id)
+    if details:
+        name, blob, sha256 = details
+        preview_cache.request(stored_path(target_folder, name, blob), sha256,
+                              lambda image: show_preview(preview_label, image))
+    else:
+        show_preview(preview_label, None)
+
     scrollbar.pack(side="right", fill="y")
-    text_box.configure(yscrollcommand=scrollbar.set)
-    text_box.insert("end", formatted_content)
-    text_box.configure(state="disabled", spacing1=7)
+    text_box.configure(spacing1=7)
+    popup_text.load(database.pages(document_id), formatted_content)
     text_box.pack(fill="both", expand=True)
-    if search:
-        highlight_text(text_box, search)
+    if search_terms:
+        jump_to_hit(text_box, popup_text, hit_label)
 
     def close_popup(event):
         popup.destroy()
     popup.bind("<FocusOut>", close_popup)
 
 
-# Highlight searched text
-def highlight_text(popup_text_box, search):
-    search_terms = search.split()
-    for term in search_terms:
-        start = "1.0"  # Start position: first line, first character
-        while True:
-            start = popup_text_box.search(term, start, stopindex="end", nocase=True)
-            if not start:
-                break
-            end = f"{start}+{len(term)}c"  # "c" = characters. For the calculation of the end position
-            popup_text_box.tag_add("highlight", start, end)
-            start = end  # Updates start to the end position so that the next search begins after it.
-        popup_text_box.tag_config("highlight", background="#144870", foreground="#DCE4EE", font=("Arial", 13, "bold"))
+# Show the preview once it is available, the popup may have been closed in the meantime
+def show_preview(preview_label, image):
+    if not preview_label.winfo_exists():
+        return
+    if image is None:
+        preview_label.configure(text="Keine Vorschau")
+    else:
+        preview_label.configure(image=CTkImage(light_image=image, dark_image=image, size=image.size), text="")
+
+
+# Highlight the search terms in text that was added to the popup. The positions are found in one pass
+# (dopi.search.match_ranges) and tagged with a single call.
+def highlight_text(popup_text_box, start, text, search_terms):
+    ranges = match_ranges(text, search_terms)
+    if ranges:
+        popup_text_box.tag_add("highlight", *text_indices(start, text, [i for hit in ranges for i in hit]))
+
+
+# Mark the next (or previous) hit and scroll to it. More text is loaded while the next hit is not shown yet, but
+# at most HIT_SEARCH_CHUNKS parts per call: a term the full-text search matched but the highlighting does not
+# (e.g. "(4711") would otherwise render the whole document at once. The next call continues the search.
+def jump_to_hit(popup_text_box, popup_text, hit_label, forward=True):
+    current = popup_text_box.tag_ranges("current_hit")
+    loaded = 0
+    while True:
+        if forward:
+            hit = popup_text_box.tag_nextrange("highlight", current[1] if current else "1.0")
+        else:
+            hit = popup_text_box.tag_prevrange("highlight", current[0] if current else "1.0")
+        if hit or not forward or not popup_text.has_more or loaded >= HIT_SEARCH_CHUNKS:
+            break
+        popup_text.load_more()
+        loaded += 1
+    if hit:
+        popup_text_box.tag_remove("current_hit", "1.0", "end")
+        popup_text_box.tag_add("current_hit", *hit)
+        popup_text_box.see(hit[0])
+    hits = [str(index) for index in popup_text_box.tag_ranges("highlight")[::2]]
+    current = popup_text_box.tag_ranges("current_hit")
+    position = hits.index(str(current[0])) + 1 if current else 0
+    hit_label.configure(text=f"Treffer {position} von {len(hits)}{'+' if popup_text.has_more else ''}")
 
 
 # Open popup for the double-clicked line
@@ -372,22 +628,17 @@ def on_row_click(event):
     selected_item = tree.focus()
     if selected_item:
         row_values = tree.item(selected_item)['values']
-        connection = sqlite3.connect(os.path.join(target_folder, "DOPI.db"))
-        cursor = connection.cursor()
-        cursor.execute("SELECT name, keyword1, keyword2, date, content FROM documents WHERE name = ?",
-                       (row_values[1],))
-        content = cursor.fetchall()
+        content = database.details(row_values[0])
         # Position of the popup
         x, y = table_frame.winfo_rootx() + 290, table_frame.winfo_rooty() + 21
-        connection.close()
-        show_popup(content, x, y)
+        show_popup(content, row_values[0], x, y)
 
 
 # Open file
 def open_file():
     selected_item = tree.focus()
     item_values = tree.item(selected_item)['values']
-    file_path = os.path.join(target_folder, item_values[1])
+    file_path = stored_path(target_folder, *database.stored_file(item_values[0]))
     if os.path.exists(file_path):
         try:
             os.startfile(file_path)
@@ -408,16 +659,17 @@ def delete():
                            icon="warning", cancel_button="none")
     if result.get() == "Nein":
         return
-    connection = sqlite3.connect(os.path.join(target_folder, "DOPI.db"))
-    cursor = connection.cursor()
-    cursor.execute('DELETE FROM documents WHERE name = ?', (item_values[1],))
-    connection.commit()
-    connection.close()
+    name, blob = database.stored_file(item_values[0])
+    database.delete(name)
 
-    file_path = os.path.join(target_folder, item_values[1])
+    file_path = stored_path(target_folder, name, blob)
     if os.path.exists(file_path):
         try:
-            os.remove(file_path)
+            if blob:
+                # Other documents with the same content keep the blob
+                release_blob(database, blob)
+            else:
+                os.remove(file_path)
         except Exception as e:
             CTkMessagebox(title="Fehler", message=f"Die Datei konnte nicht gelöscht werden: {e}", icon="cancel")
     else:
@@ -437,179 +689,256 @@ def button_state(event):
         delete_button.configure(state="disabled")
 
 
-# Creating the GUI
-root = CTk()
-root.title("DOPI")
-app_width, app_height = 1280, 800
-set_appearance_mode("dark")
-root.resizable(False, False)
-# Place window in the centre of the screen
-root.geometry(f"{app_width}x{app_height}+{(root.winfo_screenwidth() - app_width) // 2}+"
-              f"{(root.winfo_screenheight() - app_height) // 2}")
-# Dynamic adjustment of the scaling
-root.tk.call("tk", "scaling", root.winfo_fpixels('1i') / 72)
-
-# Tab groups
-tabview = CTkTabview(master=root, segmented_button_fg_color="#404245", segmented_button_unselected_color="#404245",
-                     segmented_button_unselected_hover_color="#565B5E")
-tabview.pack(fill="both", expand=True)
-tabview.add("Dokument scannen")
-tabview.add("Übersicht")
-for button in tabview._segmented_button._buttons_dict.values():
-    button.configure(width=200)
-
-# Frame for the sidebar
-sidebar_frame = CTkFrame(master=tabview.tab("Dokument scannen"), border_width=5, border_color="#343638")
-sidebar_frame.pack(fill="y", padx=(120, 20), pady=(50, 130), side="left")
-
-# Frame for Dokument scannen
-scan_frame = CTkFrame(master=tabview.tab("Dokument scannen"))
-scan_frame.pack(fill="both", expand=True, padx=20, pady=(50, 0), side="left")
-
-# Segment Button
-segment_type = CTkSegmentedButton(master=sidebar_frame, values=["PDF", "IMG"], command=segment_event,
-                                  fg_color="#404245", unselected_color="#404245", unselected_hover_color="#565B5E")
-segment_type.set("PDF")
-segment_type.pack(fill="x", padx=20, pady=10)
-
-segment_archiv = CTkSegmentedButton(master=sidebar_frame, values=["Copy", "Move"], fg_color="#404245",
-                                    unselected_color="#404245", unselected_hover_color="#565B5E")
-segment_archiv.set("Copy")
-segment_archiv.pack(fill="x", padx=20, pady=10)
-
-# Button for scanning
-scan_button = CTkButton(master=sidebar_frame, text="Öffnen", corner_radius=32, command=handle_pdf_scan)
-scan_button.pack(padx=20, pady=10)
-
-# Button for clearing the keywords
-clear_button = CTkButton(master=sidebar_frame, text="Schlagworte leeren", corner_radius=32, command=clear)
-clear_button.pack(padx=20, pady=10)
-
-# Button for inserting into the database
-insert_button = CTkButton(master=sidebar_frame, text="Daten speichern", corner_radius=32,
-                          command=lambda: [insert_data(name_entry.get(), keyword1_entry.get(),
-                                                       keyword2_entry.get(), date_entry.get(),
-                                                       content_textbox.get("1.0", END),
-                                                       segment_archiv.get())])
-insert_button.pack(padx=10, pady=(282, 10))
-
-# Button to change the path
-path_button = CTkButton(master=sidebar_frame, text="Pfad ändern", corner_radius=32, command=save_path)
-path_button.pack(padx=10, pady=(10, 0))
-
-# Input fields for the texts
-name_label = CTkLabel(master=scan_frame, text="Dokumentenname")
-name_label.grid(row=1, column=0, padx=10, pady=10, sticky="w")
-name_entry = CTkEntry(master=scan_frame, width=600, placeholder_text="Wird automatisch ausgefüllt...")
-name_entry.configure(state="disabled")
-name_entry.grid(row=1, column=1, padx=10, pady=10)
-
-keyword1_label = CTkLabel(master=scan_frame, text="Schlagwort")
-keyword1_label.grid(row=2, column=0, padx=10, pady=10, sticky="w")
-keyword1_entry = CTkEntry(master=scan_frame, width=600)
-keyword1_entry.grid(row=2, column=1, padx=10, pady=10)
-
-keyword2_label = CTkLabel(master=scan_frame, text="Schlagwort")
-keyword2_label.grid(row=3, column=0, padx=10, pady=10, sticky="w")
-keyword2_entry = CTkEntry(master=scan_frame, width=600)
-keyword2_entry.grid(row=3, column=1, padx=10, pady=10)
-
-date_label = CTkLabel(master=scan_frame, text="Datum")
-date_label.grid(row=4, column=0, padx=10, pady=10, sticky="w")
-date_entry = CTkEntry(master=scan_frame, placeholder_text="TT.MM.JJJJ", width=600)
-date_entry.grid(row=4, column=1, padx=10, pady=10)
-
-content_label = CTkLabel(master=scan_frame, text="Inhalt")
-content_label.grid(row=5, column=0, padx=10, pady=10, sticky="w")
-
-content_textbox = CTkTextbox(master=scan_frame, border_width=2, height=300, width=600, wrap="word", fg_color="#343638")
-content_textbox.grid(row=5, column=1, padx=10, pady=10)
-
-path_label = CTkLabel(master=scan_frame, text="Speicherpfad")
-path_label.grid(row=6, column=0, padx=10, pady=10, sticky="w")
-path_entry = CTkEntry(master=scan_frame, placeholder_text="Speicherpfad", width=600)
-path_entry.grid(row=6, column=1, padx=10, pady=10)
-
-# Hidden message Box
-display_text = tk.StringVar()
-message = CTkTextbox(master=scan_frame, border_width=0, height=110, width=600, fg_color="#2B2B2B", state="disabled")
-message.grid(row=7, column=1, padx=10, pady=10)
-
-# Tab 2 ---------------------------------------------------------------------------------------------------------------
-
-# Frame for the buttons and the search field
-top_frame = CTkFrame(master=tabview.tab("Übersicht"))
-top_frame.pack(fill="x", padx=20, pady=(20, 0))
-
-# Frame for the Treeview table
-table_frame = CTkFrame(master=tabview.tab("Übersicht"))
-table_frame.pack(expand=True, fill="both", padx=(20, 0), pady=20)
-
-# Creating the treeview table
-tree = ttk.Treeview(master=table_frame, columns=[f"Col{i}" for i in range(0, 6)], show="headings", selectmode="browse",
-                    displaycolumns=(1, 2, 3, 4, 5))
-tree.column(1, minwidth=150, width=200)
-tree.column(2, minwidth=150, width=200)
-tree.column(3, minwidth=150, width=200)
-tree.column(4, minwidth=70, width=70)
-tree.column(5, minwidth=200, width=540)
-tree.pack(expand=True, fill="both", side="left")
-
-# Headings of the table
-tree.heading(1, text="Name")
-tree.heading(2, text="Schlagwort")
-tree.heading(3, text="Schlagwort")
-tree.heading(4, text="Datum")
-tree.heading(5, text="Inhalt")
-
-# Create CTkScrollbar for the Treeview-Table
-ctk_textbox_scrollbar = CTkScrollbar(master=table_frame, command=tree.yview, fg_color="#2B2B2B")
-ctk_textbox_scrollbar.pack(fill="y", side="left")
-# Connect the textbox scroll event with the CTkScrollbar
-tree.configure(yscrollcommand=ctk_textbox_scrollbar.set)
-
-# Changing the style of the table
-style = ttk.Style()
-style.theme_use("alt")
-# Config the treeview colors
-style.configure("Treeview", background="#343638", foreground="#DCE4EE", rowheight=50, fieldbackground="#343638")
-style.configure("Treeview.Heading", background="#1F6AA5", foreground="#DCE4EE", rowheight=75)
-# Change selected color
-style.map("Treeview", background=[("selected", "#144870")])
-style.map("Treeview.Heading", background=[("active", "#144870")])
-# Create striped row tags
-tree.tag_configure("oddrow", background="#404245")
-tree.tag_configure("evenrow", background="#343638")
-
-# Button for opening the file from the selected line
-open_button = CTkButton(master=top_frame, text="Datei öffnen", corner_radius=32, command=open_file, state="disabled")
-open_button.grid(row=0, column=0, padx=5, pady=10, sticky="w")
-
-# Button for deleting the file from the selected line
-delete_button = CTkButton(master=top_frame, text="Datei löschen", corner_radius=32, command=delete, state="disabled")
-delete_button.grid(row=0, column=1, padx=5, pady=10, sticky="w")
-
-# Search field for the database
-search_field_entry = CTkEntry(master=top_frame, placeholder_text="Suche...")
-search_field_entry.grid(row=0, column=2, padx=(100, 0), pady=10, sticky="ew")
-
-# Grid configuration for the Top_Frame
-top_frame.grid_rowconfigure(0, weight=1)
-top_frame.grid_columnconfigure(0, weight=0)
-top_frame.grid_columnconfigure(1, weight=0)
-top_frame.grid_columnconfigure(2, weight=1)
-
-# Bind events
-tree.bind("<Double-1>", on_row_click)
-search_field_entry.bind("<KeyRelease>", search_document)
-tree.bind("<<TreeviewSelect>>", button_state)
-
-# Initialisation
-load_path()
-first_path()
-path_entry.insert("0", target_folder)
-path_entry.configure(state="readonly")
-read_data()
-
-# Start GUI loop
-root.mainloop()
+# The GUI is only built when DOPI.py is started, worker processes of the batch import import this module again
+if __name__ == "__main__":
+    # Creating the GUI
+    root = CTk()
+    root.title("DOPI")
+    app_width, app_height = 1280, 800
+    set_appearance_mode("dark")
+    root.resizable(False, False)
+    # Place window in the centre of the screen
+    root.geometry(f"{app_width}x{app_height}+{(root.winfo_screenwidth() - app_width) // 2}+"
+                  f"{(root.winfo_screenheight() - app_height) // 2}")
+    # Dynamic adjustment of the scaling
+    root.tk.call("tk", "scaling", root.winfo_fpixels('1i') / 72)
+
+    # Tab groups
+    tabview = CTkTabview(master=root, segmented_button_fg_color="#404245", segmented_button_unselected_color="#404245",
+                         segmented_button_unselected_hover_color="#565B5E")
+    tabview.pack(fill="both", expand=True)
+    tabview.add("Dokument scannen")
+    tabview.add("Übersicht")
+    tabview.add("Statistik")
+    for button in tabview._segmented_button._buttons_dict.values():
+        button.configure(width=200)
+
+    # Frame for the sidebar
+    sidebar_frame = CTkFrame(master=tabview.tab("Dokument scannen"), border_width=5, border_color="#343638")
+    sidebar_frame.pack(fill="y", padx=(120, 20), pady=(50, 130), side="left")
+
+    # Frame for Dokument scannen
+    scan_frame = CTkFrame(master=tabview.tab("Dokument scannen"))
+    scan_frame.pack(fill="both", expand=True, padx=20, pady=(50, 0), side="left")
+
+    # Segment Button
+    segment_type = CTkSegmentedButton(master=sidebar_frame, values=["PDF", "IMG"], command=segment_event,
+                                      fg_color="#404245", unselected_color="#404245", unselected_hover_color="#565B5E")
+    segment_type.set("PDF")
+    segment_type.pack(fill="x", padx=20, pady=10)
+
+    segment_archiv = CTkSegmentedButton(master=sidebar_frame, values=["Copy", "Move"], fg_color="#404245",
+                                        unselected_color="#404245", unselected_hover_color="#565B5E")
+    segment_archiv.set("Copy")
+    segment_archiv.pack(fill="x", padx=20, pady=10)
+
+    segment_profile = CTkSegmentedButton(master=sidebar_frame, values=list(PROFILE_LABELS), command=profile_event,
+                                         fg_color="#404245", unselected_color="#404245",
+                                         unselected_hover_color="#565B5E")
+    segment_profile.set({name: label for label, name in PROFILE_LABELS.items()}[profile_name()])
+    segment_profile.pack(fill="x", padx=20, pady=10)
+
+    # Button for scanning
+    scan_button = CTkButton(master=sidebar_frame, text="Öffnen", corner_radius=32, command=handle_pdf_scan)
+    scan_button.pack(padx=20, pady=10)
+
+    # Button for cancelling a running scan
+    cancel_button = CTkButton(master=sidebar_frame, text="Scan abbrechen", corner_radius=32, command=cancel_scan,
+                              state="disabled")
+    cancel_button.pack(padx=20, pady=10)
+
+    # Button for importing a whole folder
+    import_button = CTkButton(master=sidebar_frame, text="Ordner importieren", corner_radius=32, command=import_folder)
+    import_button.pack(padx=20, pady=10)
+
+    # Button for clearing the keywords
+    clear_button = CTkButton(master=sidebar_frame, text="Schlagworte leeren", corner_radius=32, command=clear)
+    clear_button.pack(padx=20, pady=10)
+
+    # Button for inserting into the database
+    insert_button = CTkButton(master=sidebar_frame, text="Daten speichern", corner_radius=32,
+                              command=lambda: [insert_data(name_entry.get(), keyword1_entry.get(),
+                                                           keyword2_entry.get(), date_entry.get(),
+                                                           scanned_pages(),
+                                                           segment_archiv.get())])
+    insert_button.pack(padx=10, pady=(138, 10))
+
+    # Button to change the path
+    path_button = CTkButton(master=sidebar_frame, text="Pfad ändern", corner_radius=32, command=save_path)
+    path_button.pack(padx=10, pady=(10, 0))
+
+    # Input fields for the texts
+    name_label = CTkLabel(master=scan_frame, text="Dokumentenname")
+    name_label.grid(row=1, column=0, padx=10, pady=10, sticky="w")
+    name_entry = CTkEntry(master=scan_frame, width=600, placeholder_text="Wird automatisch ausgefüllt...")
+    name_entry.configure(state="disabled")
+    name_entry.grid(row=1, column=1, padx=10, pady=10)
+
+    keyword1_label = CTkLabel(master=scan_frame, text="Schlagwort")
+    keyword1_label.grid(row=2, column=0, padx=10, pady=10, sticky="w")
+    keyword1_entry = CTkEntry(master=scan_frame, width=600)
+    keyword1_entry.grid(row=2, column=1, padx=10, pady=10)
+
+    keyword2_label = CTkLabel(master=scan_frame, text="Schlagwort")
+    keyword2_label.grid(row=3, column=0, padx=10, pady=10, sticky="w")
+    keyword2_entry = CTkEntry(master=scan_frame, width=600)
+    keyword2_entry.grid(row=3, column=1, padx=10, pady=10)
+
+    date_label = CTkLabel(master=scan_frame, text="Datum")
+    date_label.grid(row=4, column=0, padx=10, pady=10, sticky="w")
+    date_entry = CTkEntry(master=scan_frame, placeholder_text="TT.MM.JJJJ", width=600)
+    date_entry.grid(row=4, column=1, padx=10, pady=10)
+
+    content_label = CTkLabel(master=scan_frame, text="Inhalt")
+    content_label.grid(row=5, column=0, padx=10, pady=10, sticky="w")
+
+    content_textbox = CTkTextbox(master=scan_frame, border_width=2, height=300, width=600, wrap="word",
+                                 fg_color="#343638")
+    content_textbox.grid(row=5, column=1, padx=10, pady=10)
+    # Scanned pages, long documents are shown in parts. The text can be corrected before saving.
+    content_preview = LazyText(content_textbox._textbox, content_textbox._y_scrollbar.set)
+
+    path_label = CTkLabel(master=scan_frame, text="Speicherpfad")
+    path_label.grid(row=6, column=0, padx=10, pady=10, sticky="w")
+    path_entry = CTkEntry(master=scan_frame, placeholder_text="Speicherpfad", width=600)
+    path_entry.grid(row=6, column=1, padx=10, pady=10)
+
+    # Hidden message Box
+    display_text = tk.StringVar()
+    message = CTkTextbox(master=scan_frame, border_width=0, height=110, width=600, fg_color="#2B2B2B", state="disabled")
+    message.grid(row=7, column=1, padx=10, pady=10)
+
+    # Tab 2 -----------------------------------------------------------------------------------------------------------
+
+    # Frame for the buttons and the search field
+    top_frame = CTkFrame(master=tabview.tab("Übersicht"))
+    top_frame.pack(fill="x", padx=20, pady=(20, 0))
+
+    # Frame for the Treeview table
+    table_frame = CTkFrame(master=tabview.tab("Übersicht"))
+    table_frame.pack(expand=True, fill="both", padx=(20, 0), pady=20)
+
+    # Creating the treeview table
+    tree = ttk.Treeview(master=table_frame, columns=[f"Col{i}" for i in range(0, 7)], show="headings",
+                        selectmode="browse", displaycolumns=(1, 2, 3, 4, 5, 6))
+    tree.column(1, minwidth=150, width=200)
+    tree.column(2, minwidth=150, width=200)
+    tree.column(3, minwidth=150, width=200)
+    tree.column(4, minwidth=70, width=70)
+    tree.column(5, minwidth=200, width=480)
+    tree.column(6, minwidth=60, width=60)
+    tree.pack(expand=True, fill="both", side="left")
+
+    # Headings of the table
+    tree.heading(1, text="Name")
+    tree.heading(2, text="Schlagwort")
+    tree.heading(3, text="Schlagwort")
+    tree.heading(4, text="Datum", command=sort_by_date)
+    tree.heading(5, text="Inhalt")
+    tree.heading(6, text="Seite")
+
+    # Create CTkScrollbar for the Treeview-Table
+    ctk_textbox_scrollbar = CTkScrollbar(master=table_frame, command=tree.yview, fg_color="#2B2B2B")
+    ctk_textbox_scrollbar.pack(fill="y", side="left")
+    # Connect the textbox scroll event with the CTkScrollbar, rows are loaded page by page
+    tree_pages = PagedTreeview(tree, ctk_textbox_scrollbar)
+
+    # Changing the style of the table
+    style = ttk.Style()
+    style.theme_use("alt")
+    # Config the treeview colors
+    style.configure("Treeview", background="#343638", foreground="#DCE4EE", rowheight=50, fieldbackground="#343638")
+    style.configure("Treeview.Heading", background="#1F6AA5", foreground="#DCE4EE", rowheight=75)
+    # Change selected color
+    style.map("Treeview", background=[("selected", "#144870")])
+    style.map("Treeview.Heading", background=[("active", "#144870")])
+    # Create striped row tags
+    tree.tag_configure("oddrow", background="#404245")
+    tree.tag_configure("evenrow", background="#343638")
+
+    # Button for opening the file from the selected line
+    open_button = CTkButton(master=top_frame, text="Datei öffnen", corner_radius=32, command=open_file,
+                            state="disabled")
+    open_button.grid(row=0, column=0, padx=5, pady=10, sticky="w")
+
+    # Button for deleting the file from the selected line
+    delete_button = CTkButton(master=top_frame, text="Datei löschen", corner_radius=32, command=delete,
+                              state="disabled")
+    delete_button.grid(row=0, column=1, padx=5, pady=10, sticky="w")
+
+    # Search field for the database
+    search_field_entry = CTkEntry(master=top_frame, placeholder_text="Suche...")
+    search_field_entry.grid(row=0, column=2, padx=(100, 0), pady=10, sticky="ew")
+
+    # Filters by date range and keyword
+    filter_frame = CTkFrame(master=top_frame, fg_color="transparent")
+    filter_frame.grid(row=1, column=0, columnspan=3, padx=5, pady=(0, 10), sticky="ew")
+    date_from_label = CTkLabel(master=filter_frame, text="Von")
+    date_from_label.pack(side="left", padx=(0, 5))
+    date_from_entry = CTkEntry(master=filter_frame, placeholder_text="TT.MM.JJJJ", width=110)
+    date_from_entry.pack(side="left", padx=(0, 15))
+    date_to_label = CTkLabel(master=filter_frame, text="Bis")
+    date_to_label.pack(side="left", padx=(0, 5))
+    date_to_entry = CTkEntry(master=filter_frame, placeholder_text="TT.MM.JJJJ", width=110)
+    date_to_entry.pack(side="left", padx=(0, 15))
+    filter_border_color = date_from_entry.cget("border_color")
+    keyword_menu = CTkOptionMenu(master=filter_frame, values=[ALL_KEYWORDS], command=apply_filters, width=250,
+                                 dynamic_resizing=False)
+    keyword_menu.pack(side="left", padx=(0, 15))
+    reset_filter_button = CTkButton(master=filter_frame, text="Filter zurücksetzen", corner_radius=32,
+                                    command=reset_filters)
+    reset_filter_button.pack(side="left")
+
+    # Grid configuration for the Top_Frame
+    top_frame.grid_rowconfigure(0, weight=1)
+    top_frame.grid_columnconfigure(0, weight=0)
+    top_frame.grid_columnconfigure(1, weight=0)
+    top_frame.grid_columnconfigure(2, weight=1)
+
+    # Bind events
+    tree.bind("<Double-1>", on_row_click)
+    search_field_entry.bind("<KeyRelease>", search_document)
+    for date_filter_entry in (date_from_entry, date_to_entry):
+        date_filter_entry.bind("<Return>", apply_filters)
+        date_filter_entry.bind("<FocusOut>", apply_filters)
+    tree.bind("<<TreeviewSelect>>", button_state)
+
+    # Statistics of the instrumentation (dopi.metrics)
+    stats_frame = CTkFrame(master=tabview.tab("Statistik"))
+    stats_frame.pack(expand=True, fill="both", padx=20, pady=20)
+    if enabled():
+        stats_tree = ttk.Treeview(master=stats_frame, columns=[f"Col{i}" for i in range(0, 5)], show="headings",
+                                  selectmode="none")
+        for column, (heading, width) in enumerate([("Stufe", 300), ("Anzahl", 120), ("p50 (ms)", 150),
+                                                   ("p95 (ms)", 150), ("pro Minute", 150)]):
+            stats_tree.heading(column, text=heading)
+            stats_tree.column(column, minwidth=80, width=width)
+        stats_tree.tag_configure("oddrow", background="#404245")
+        stats_tree.tag_configure("evenrow", background="#343638")
+        stats_tree.pack(expand=True, fill="both")
+        show_stats()
+    else:
+        stats_label = CTkLabel(master=stats_frame, text='Die Messung ist ausgeschaltet. Sie wird in der config.json '
+                                                        'mit "Instrumentation": true eingeschaltet.')
+        stats_label.pack(padx=20, pady=20)
+
+    # Search queries run debounced on a worker thread
+    search_engine = SearchEngine(root, show_search_results, database, tree_pages.page_size)
+    # Previews of the popup are rendered on a worker thread
+    preview_cache = PreviewCache(root, database)
+
+    # Initialisation, an existing database is migrated to the current schema. A missing one is not created here,
+    # read_data asks for the path first.
+    if load_path() and os.path.exists(database.path):
+        try:
+            database.create()
+        except sqlite3.Error:
+            pass
+    first_path()
+    path_entry.insert("0", target_folder)
+    path_entry.configure(state="readonly")
+    read_data()
+    poll_changes()
+
+    # Start GUI loop
+    root.mainloop()
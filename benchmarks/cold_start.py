@@ -0,0 +1,83 @@
+"""
+Cold start of the command line and the GUI.
+
+Every run starts a new Python process in a temporary working directory with its own config.json and storage
+folder. The GUI is measured until its window has been drawn once (mainloop is replaced by a single update), this
+needs customtkinter and a display. After each run the heavy libraries that were already loaded are listed.
+
+Usage: python benchmarks/cold_start.py [--runs N]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ["customtkinter", "PIL", "pypdf", "pytesseract"]
+
+# Runs the target in the child process and prints the loaded heavy modules as the last line
+RUNNER = '''
+import json, runpy, sys
+sys.path.insert(0, {root!r})
+target, sys.argv = sys.argv[1], sys.argv[1:]
+if target == "gui":
+    import tkinter
+    tkinter.Misc.mainloop = lambda self, n=0: self.update()
+    runpy.run_path({gui!r}, run_name="__main__")
+else:
+    try:
+        runpy.run_module(target, run_name="__main__", alter_sys=True)
+    except SystemExit:
+        pass
+print(json.dumps([name for name in {heavy!r} if name in sys.modules]))
+'''
+
+COMMANDS = {
+    "python": [sys.executable, "-c", "pass"],
+    "cli --help": ["dopi", "--help"],
+    "cli search": ["dopi", "search", "rechnung"],
+    "gui": ["gui"],
+}
+
+
+def run(arguments, folder):
+    if arguments[0] != sys.executable:
+        arguments = [sys.executable, "-c", RUNNER.format(root=ROOT, gui=os.path.join(ROOT, "DOPI.py"),
+                                                         heavy=HEAVY_MODULES)] + arguments
+    start = time.perf_counter()
+    process = subprocess.run(arguments, cwd=folder, capture_output=True, text=True)
+    seconds = time.perf_counter() - start
+    if process.returncode != 0:
+        raise RuntimeError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "Fehler")
+    lines = process.stdout.strip().splitlines()
+    return seconds, json.loads(lines[-1]) if lines and lines[-1].startswith("[") else []
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Messungen pro Befehl")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as folder:
+        storage = os.path.join(folder, "storage")
+        os.mkdir(storage)
+        with open(os.path.join(folder, "config.json"), "w") as config_file:
+            json.dump({"Storage path": storage}, config_file)
+        for label, arguments in COMMANDS.items():
+            try:
+                results = [run(arguments, folder) for _ in range(args.runs)]
+            except RuntimeError as e:
+                print(f"{label:12} übersprungen: {e}")
+                continue
+            seconds = [result[0] for result in results]
+            loaded = ", ".join(results[-1][1]) or "-"
+            print(f"{label:12} {statistics.median(seconds) * 1000:7.0f} ms (min {min(seconds) * 1000:.0f} ms)  "
+                  f"geladen: {loaded}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""
+Stress test of several DOPI instances writing to the same storage folder.
+
+N processes start at the same moment on a new DOPI.db (all of them create and migrate it), then every process
+saves documents one transaction at a time as the GUI does, deletes every fifth of its documents again and reads
+the overview and the search in between. Meanwhile the parent process follows the changes with a ChangeMonitor.
+Checked are: no process fails, every saved document that was not deleted is in the database with its pages, the
+full-text indexes are intact and the monitor was told about every change after its first poll.
+
+All processes run on this computer. For a storage folder on a network share the test only shows that the locking
+works from one client; run it with --journal-mode DELETE (WAL does not work over a network file system) and, to
+cover several clients, on each computer at the same time with its own --prefix.
+
+Usage: python benchmarks/concurrency.py [--processes N] [--documents N] [--folder FOLDER] [--journal-mode MODE]
+                                        [--prefix TEXT]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dopi.changes import ChangeMonitor
+from dopi.database import JOURNAL_MODES, Database
+from dopi.search import FIRST_LIST_KEY, FIRST_PAGE, search_page
+
+PAGE_TEXT = "Rechnung Vertrag Lieferung Kosten Miete Steuer " * 40
+
+
+# One instance: returns (number of errors, first error, seconds per save)
+def instance(folder, journal_mode, prefix, number, documents, start):
+    database = Database(folder, journal_mode)
+    start.wait()
+    errors, first_error, saves = 0, None, []
+    try:
+        database.create()
+    except Exception as e:
+        return documents, f"create: {e}", []
+    for i in range(documents):
+        name = f"{prefix}{number}-{i:05d}.pdf"
+        try:
+            began = time.perf_counter()
+            database.upsert(name, f"Schlagwort{number}", "", f"{i % 28 + 1:02d}.01.2024", [PAGE_TEXT, name])
+            saves.append(time.perf_counter() - began)
+            if i % 5 == 4:
+                database.delete(name)
+            database.list_page(FIRST_LIST_KEY, 200)
+            search_page(database.connection(), ["rechnung", f"{prefix}{number}"], FIRST_PAGE, 200)
+        except Exception as e:
+            errors += 1
+            first_error = first_error or f"{name}: {e}"
+    return errors, first_error, saves
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4, help="Anzahl der Instanzen")
+    parser.add_argument("--documents", type=int, default=200, help="Dokumente pro Instanz")
+    parser.add_argument("--folder", help="Speicherordner (Standard: temporärer Ordner)")
+    parser.add_argument("--journal-mode", choices=JOURNAL_MODES, help="Journalmodus (Standard: aus config.json)")
+    parser.add_argument("--prefix", default="p", help="Anfang der Dokumentnamen, je Computer verschieden")
+    args = parser.parse_args(argv)
+    folder = args.folder or tempfile.mkdtemp(prefix="dopi-concurrency-")
+
+    manager = multiprocessing.Manager()
+    start = manager.Event()
+    with multiprocessing.Pool(args.processes) as pool:
+        results = [pool.apply_async(instance, (folder, args.journal_mode, args.prefix, number, args.documents,
+                                               start)) for number in range(args.processes)]
+        began = time.perf_counter()
+        start.set()
+        database = Database(folder, args.journal_mode)
+        monitor = ChangeMonitor(database)
+        seen, reloads, baseline = set(), 0, None
+        while not all(result.ready() for result in results):
+            time.sleep(0.05)
+            if not os.path.exists(database.path):
+                continue
+            try:
+                document_ids = monitor.poll()
+                if baseline is None:
+                    # Changes before the first poll are not reported
+                    baseline = database.last_change()
+            except Exception:
+                # The database is still being created by the instances
+                continue
+            if document_ids is None:
+                reloads += 1
+            else:
+                seen |= document_ids
+        results = [result.get() for result in results]
+        seconds = time.perf_counter() - began
+    document_ids = monitor.poll()
+    seen |= document_ids or set()
+
+    connection = database.connection()
+    expected = {f"{args.prefix}{number}-{i:05d}.pdf" for number in range(args.processes)
+                for i in range(args.documents) if i % 5 != 4}
+    # Documents of the instances on this computer
+    pattern = args.prefix + "[0-9]*-*"
+    names = dict(connection.execute("SELECT name, id FROM documents WHERE name GLOB ?", (pattern,)))
+    pages = connection.execute("SELECT count(*) FROM pages JOIN documents ON documents.id = pages.document_id "
+                               "WHERE name GLOB ?", (pattern,)).fetchone()[0]
+    failures = []
+    errors = sum(result[0] for result in results)
+    if errors:
+        failures.append(f"{errors} Fehler, zuerst: {next(result[1] for result in results if result[1])}")
+    if set(names) != expected:
+        failures.append(f"{len(expected - set(names))} Dokumente fehlen, {len(set(names) - expected)} zu viel")
+    if pages != 2 * len(expected):
+        failures.append(f"{pages} Seiten statt {2 * len(expected)}")
+    for table in ("documents_fts", "pages_fts"):
+        try:
+            connection.execute(f"INSERT INTO {table} ({table}) VALUES ('integrity-check')")
+        except Exception as e:
+            failures.append(f"{table}: {e}")
+    changed = {row[0] for row in connection.execute("SELECT document_id FROM changes WHERE seq > ?",
+                                                     (baseline or 0,))}
+    missed = changed - seen
+    if missed and not reloads:
+        failures.append(f"{len(missed)} Änderungen nicht erkannt")
+
+    saves = sorted(save for result in results for save in result[2])
+    print(f"{args.processes} Instanzen, {len(saves)} Speichervorgänge in {seconds:.1f} s, "
+          f"Median {saves[len(saves) // 2] * 1000:.1f} ms, Maximum {saves[-1] * 1000:.0f} ms" if saves else
+          f"{args.processes} Instanzen, keine Speichervorgänge")
+    print(f"Änderungen erkannt: {len(seen)} Dokumente, {reloads} vollständige Neuladungen")
+    for failure in failures:
+        print(f"FEHLER: {failure}")
+    print("OK" if not failures else "FEHLGESCHLAGEN")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
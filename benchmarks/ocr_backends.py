@@ -0,0 +1,50 @@
+"""
+Benchmark of the OCR backends (images per second).
+
+Generates small receipt-like images and scans them with every backend of dopi.ocr.
+
+Usage: python benchmarks/ocr_backends.py [--images N] [--batch N]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+from dopi.ocr import BACKENDS
+
+
+# Small white image with a few lines of black text
+def make_image(path, number):
+    image = Image.new("L", (600, 200), 255)
+    draw = ImageDraw.Draw(image)
+    for line, text in enumerate([f"Quittung Nr. {number}", "Bürobedarf 12,50 EUR", "Summe 12,50 EUR"]):
+        draw.text((20, 20 + line * 50), text, fill=0)
+    image.save(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--images", type=int, default=40, help="Anzahl der Bilder")
+    parser.add_argument("--batch", type=int, default=8, help="Bilder pro Aufruf des Backends")
+    args = parser.parse_args(argv)
+    with tempfile.TemporaryDirectory() as folder:
+        paths = [os.path.join(folder, f"receipt{i}.png") for i in range(args.images)]
+        for number, path in enumerate(paths):
+            make_image(path, number)
+        for name, backend in BACKENDS.items():
+            backend = backend()
+            start = time.perf_counter()
+            for i in range(0, len(paths), args.batch):
+                backend.image_to_string(paths[i:i + args.batch])
+            seconds = time.perf_counter() - start
+            print(f"{name:10} {len(paths) / seconds:8.2f} Bilder/s ({seconds:.2f} s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+Benchmark suite of the core operations, results are written as JSON.
+
+Synthetic catalogues (DOPI.db with OCR-sized page texts) are generated once per size and kept in the data folder,
+sample PNG and PDF files are generated as well. Measured are the search (single term, several terms, no hit), the
+overview (first page, loading all rows, a date range and the keyword counts), saving documents (one per transaction
+as in the GUI and in chunks as in the folder import), PDF text extraction and OCR. OCR is skipped if Tesseract is
+not installed. No display needed.
+
+Usage: python benchmarks/suite.py [--sizes 1000,100000] [--data FOLDER] [--output FILE] [--compare FILE]
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from dopi.database import Database
+from dopi.paging import PAGE_SIZE
+from dopi.search import FIRST_LIST_KEY, FIRST_PAGE, Filters, search_page
+
+# Syllables of the generated words, every catalogue uses the same vocabulary
+SYLLABLES = ["ab", "an", "be", "da", "ein", "er", "ge", "in", "kon", "lei", "mit", "na", "ob", "re", "sch", "ta",
+             "ung", "ver", "zu", "rech", "nung", "ver", "trag", "lie", "fer", "mie", "te", "steu", "kos", "ten"]
+VOCABULARY_SIZE = 20000
+PAGE_CHARS = (1500, 3000)
+PAGES_PER_DOCUMENT = (1, 3)
+SEARCHES = {
+    "single term": ["rechnung"],
+    "multi term": ["rechnung", "vertrag", "2023"],
+    "no hit": ["xqzjvw"],
+}
+REPEAT = 5
+
+
+# Words and their cumulative weights: word frequencies roughly like natural language (few frequent, many rare words)
+def vocabulary(rng):
+    words = {"rechnung", "vertrag", "lieferschein", "mietvertrag", "steuer", "2022", "2023", "2024"}
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    words = sorted(words)
+    rng.shuffle(words)
+    return words, list(itertools.accumulate(1 / rank for rank in range(1, len(words) + 1)))
+
+
+def page_text(rng, words, weights):
+    text, length = [], 0
+    target = rng.randint(*PAGE_CHARS)
+    while length < target:
+        line = " ".join(rng.choices(words, cum_weights=weights, k=rng.randint(4, 12)))
+        text.append(line)
+        length += len(line) + 1
+    return "\n".join(text)
+
+
+def document_rows(rng, words, weights, count, prefix="doc"):
+    for i in range(count):
+        pages = [page_text(rng, words, weights) for _ in range(rng.randint(*PAGES_PER_DOCUMENT))]
+        yield (f"{prefix}{i:07d}.pdf", rng.choice(words), rng.choice(words),
+               f"{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.{rng.randint(2015, 2024)}", pages, None, None)
+
+
+# Catalogue with the given number of documents, generated once and reused
+def catalogue(data, size):
+    folder = os.path.join(data, f"catalogue-{size}")
+    database = Database(folder)
+    if os.path.exists(database.path):
+        database.create()
+        if database.connection().execute("SELECT count(*) FROM documents").fetchone()[0] == size:
+            return database
+        database.close()
+        os.remove(database.path)
+    os.makedirs(folder, exist_ok=True)
+    database.create()
+    rng = random.Random(size)
+    words, weights = vocabulary(rng)
+    rows = []
+    start = time.perf_counter()
+    for row in document_rows(rng, words, weights, size):
+        rows.append(row)
+        if len(rows) == 1000:
+            database.upsert_many(rows)
+            rows = []
+            print(f"\rKatalog {size}: {database.connection().execute('SELECT max(id) FROM documents').fetchone()[0]} "
+                  f"Dokumente ({time.perf_counter() - start:.0f} s)", end="", file=sys.stderr)
+    if rows:
+        database.upsert_many(rows)
+    print(file=sys.stderr)
+    return database
+
+
+# Image with a few lines of receipt text
+def make_image(path, number):
+    from PIL import Image, ImageDraw
+
+    image = Image.new("L", (1240, 1754), 255)
+    draw = ImageDraw.Draw(image)
+    for line in range(30):
+        draw.text((100, 100 + line * 50), f"Rechnung {number} Position {line} Bürobedarf 12,50 EUR", fill=0)
+    image.save(path, dpi=(150, 150))
+
+
+# PDF with a text layer, written by hand so that no PDF library is needed
+def make_text_pdf(path, pages):
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for page in range(pages):
+        lines = "".join(f"(Vertrag {page} Zeile {line} Lieferung und Rechnung) Tj 0 -14 Td " for line in range(50))
+        stream = f"BT /F1 11 Tf 50 800 Td {lines}ET"
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {len(objects)} 0 R "
+                       f"/Resources << /Font << /F1 3 0 R >> >> >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {pages} >>"
+    content, offsets = b"%PDF-1.4\n", []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(content))
+        content += f"{number} 0 obj\n{body}\nendobj\n".encode("latin-1")
+    xref = len(content)
+    content += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    content += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode()
+    content += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode()
+    with open(path, "wb") as pdf_file:
+        pdf_file.write(content)
+
+
+# Milliseconds of the repeated runs
+def measure(function, repeat=REPEAT):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append((time.perf_counter() - start) * 1000)
+    return {"median_ms": round(statistics.median(times), 3), "min_ms": round(min(times), 3), "runs": repeat}
+
+
+def load_all(database):
+    key, rows = FIRST_LIST_KEY, 0
+    while True:
+        page, key = database.list_page(key, PAGE_SIZE)
+        if not page:
+            return rows
+        rows += len(page)
+
+
+def catalogue_results(database, size):
+    results = {}
+    for label, terms in SEARCHES.items():
+        # Past the query cache, every run hits SQLite
+        results[f"search {label}"] = measure(lambda: search_page(database.connection(), terms, FIRST_PAGE, PAGE_SIZE))
+    results["overview first page"] = measure(lambda: database.list_page(FIRST_LIST_KEY, PAGE_SIZE))
+    results["overview all rows"] = measure(lambda: load_all(database), repeat=1 if size > 100000 else 3)
+    quarter = Filters("2024-07-01", "2024-09-30", order="date")
+    results["overview date range"] = measure(lambda: database.list_page(FIRST_LIST_KEY, PAGE_SIZE, quarter))
+    results["keyword counts"] = measure(lambda: database.keyword_counts())
+
+    rng = random.Random(0)
+    words, weights = vocabulary(rng)
+    rows = list(document_rows(rng, words, weights, 200, prefix="insert"))
+    for label, write in (("insert single", lambda: [database.upsert(*row) for row in rows]),
+                         ("insert chunked", lambda: database.upsert_many(rows))):
+        start = time.perf_counter()
+        write()
+        seconds = time.perf_counter() - start
+        results[label] = {"documents_per_s": round(len(rows) / seconds, 1), "documents": len(rows)}
+        with database.connection() as connection:
+            connection.execute("DELETE FROM documents WHERE name LIKE 'insert%'")
+    return results
+
+
+def extraction_results(folder):
+    from dopi.extraction import extract_image, iter_pages
+    from dopi.ocr import tesseract
+    from dopi.preprocess import PROFILES
+
+    results = {}
+    pdf = os.path.join(folder, "text.pdf")
+    make_text_pdf(pdf, 20)
+    timing = measure(lambda: list(iter_pages(pdf)))
+    results["pdf text layer"] = dict(timing, pages_per_s=round(20000 / timing["median_ms"], 1))
+    try:
+        tesseract().get_tesseract_version()
+    except Exception as e:
+        results["ocr"] = {"skipped": f"Tesseract nicht verfügbar: {e}"}
+        return results
+    image = os.path.join(folder, "receipt.png")
+    make_image(image, 1)
+    for profile in PROFILES:
+        results[f"ocr image {profile}"] = measure(lambda: extract_image(image, profile), repeat=3)
+    from PIL import Image
+
+    scanned = os.path.join(folder, "scanned.pdf")
+    with Image.open(image) as page:
+        page.save(scanned, save_all=True, append_images=[page.copy() for _ in range(3)], resolution=150)
+    timing = measure(lambda: list(iter_pages(scanned)), repeat=3)
+    results["ocr scanned pdf"] = dict(timing, pages_per_s=round(4000 / timing["median_ms"], 2))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(), "cpu_count": os.cpu_count(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+# Median times of a previous result file next to the new ones
+def compare(old, new):
+    for section, results in new["results"].items():
+        for label, result in results.items():
+            before = old["results"].get(section, {}).get(label, {}).get("median_ms")
+            if before and "median_ms" in result:
+                print(f"{section:>10} {label:22} {before:10.2f} ms -> {result['median_ms']:10.2f} ms "
+                      f"({result['median_ms'] / before:5.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,100000", help="Größen der Kataloge, z. B. 1000,100000,1000000")
+    parser.add_argument("--data", default=os.path.join(tempfile.gettempdir(), "dopi-benchmarks"),
+                        help="Ordner für die generierten Kataloge")
+    parser.add_argument("--output", help="JSON-Datei für die Ergebnisse (Standard: Ausgabe auf der Konsole)")
+    parser.add_argument("--compare", help="Frühere JSON-Datei zum Vergleich")
+    args = parser.parse_args(argv)
+
+    report = {"environment": environment(), "results": {}}
+    for size in [int(size) for size in args.sizes.split(",")]:
+        database = catalogue(args.data, size)
+        report["results"][str(size)] = catalogue_results(database, size)
+        database.close()
+    with tempfile.TemporaryDirectory() as folder:
+        report["results"]["extraction"] = extraction_results(folder)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as old:
+            compare(json.load(old), report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,7 @@
+"""
+DOPI core package.
+
+Components of the document organizer that do not depend on the GUI: dopi.database (storage and search),
+dopi.extraction (text of PDF files and images), dopi.ingest (folder import and reindex) and dopi.storage
+(archive folder). python -m dopi runs the command line interface (dopi.cli).
+"""
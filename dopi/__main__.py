@@ -0,0 +1,7 @@
+import sys
+
+from dopi.cli import main
+
+# Worker processes of the import pool import this module again, only the main process runs the command
+if __name__ == "__main__":
+    sys.exit(main())
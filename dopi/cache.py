@@ -0,0 +1,112 @@
+"""
+Extraction cache.
+
+The extracted pages of a file are stored in DOPI_cache.db next to DOPI.db, keyed by the SHA-256 of the file
+content and the extraction settings. Re-importing the same file under another name or scanning it again returns
+the text without OCR. The cache is limited in size, the least recently used entries are evicted first.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dopi.database import BUSY_TIMEOUT, is_locked, write_transaction
+from dopi.metrics import count
+
+CACHE_NAME = "DOPI_cache.db"
+MAX_BYTES = 256 * 1024 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS extractions (
+        key TEXT PRIMARY KEY,
+        pages TEXT,
+        size INTEGER,
+        last_used REAL);
+    CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used);
+    '''
+
+
+# SHA-256 of the file, read in chunks
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Cache key of a file content extracted with the given settings
+def cache_key(digest, settings):
+    return f"{digest}:{settings}"
+
+
+class ExtractionCache:
+    def __init__(self, database, max_bytes=MAX_BYTES):
+        self.database = database  # The cache is stored in the storage folder of the database
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    # Connection of the calling thread, reopened when the storage folder changed
+    def connection(self):
+        local = self._local
+        path = os.path.join(self.database.folder, CACHE_NAME)
+        if getattr(local, "path", None) != path:
+            if getattr(local, "connection", None) is not None:
+                local.connection.close()
+            local.connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT)
+            local.connection.execute(f"PRAGMA journal_mode = {self.database.journal_mode}")
+            local.connection.executescript(SCHEMA)
+            local.path = path
+        return local.connection
+
+    # Cached pages for the key or None
+    def get(self, key):
+        connection = self.connection()
+        row = connection.execute("SELECT pages FROM extractions WHERE key = ?", (key,)).fetchone()
+        count("cache.miss" if row is None else "cache.hit")
+        if row is None:
+            return None
+        try:
+            write_transaction(connection, lambda connection: connection.execute(
+                "UPDATE extractions SET last_used = ? WHERE key = ?", (time.time(), key)))
+        except sqlite3.OperationalError as error:
+            # Another instance keeps the cache busy, the entry is only evicted a little earlier
+            if not is_locked(error):
+                raise
+        return json.loads(row[0])
+
+    def put(self, key, pages):
+        data = json.dumps(pages)
+
+        def write(connection):
+            connection.execute("INSERT OR REPLACE INTO extractions (key, pages, size, last_used) VALUES (?, ?, ?, ?)",
+                               (key, data, len(data), time.time()))
+            # Evict the least recently used entries until the cache fits into its limit again
+            total = connection.execute("SELECT ifnull(sum(size), 0) FROM extractions").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = 0
+                for old_key, size in connection.execute("SELECT key, size FROM extractions ORDER BY last_used"):
+                    if total - evicted <= self.max_bytes or old_key == key:
+                        break
+                    evicted += size
+                    connection.execute("DELETE FROM extractions WHERE key = ?", (old_key,))
+        write_transaction(self.connection(), write)
+
+    # Pages of a file as (page number, page count, text). extract() is only called when the cache has no entry
+    # for the file content and settings, its pages are cached once the extraction completed.
+    def pages(self, digest, settings, extract):
+        key = cache_key(digest, settings)
+        texts = self.get(key)
+        if texts is not None:
+            for page_no, text in enumerate(texts, start=1):
+                yield page_no, len(texts), text
+            return
+        texts = []
+        for page in extract():
+            texts.append(page[2])
+            yield page
+        self.put(key, texts)
@@ -0,0 +1,174 @@
+"""
+Export and import of the catalogue as JSON Lines or CSV, for backups and for moving or merging archives.
+
+A record holds name, keywords, date, the stored file (blob, see dopi.storage), its SHA-256 and the page texts. In
+CSV the pages are a JSON list. Both directions stream in chunks of CHUNK_SIZE documents: the export reads with
+fetchmany from a single snapshot of the database, the import writes every chunk with executemany, so memory does
+not grow with the catalogue. The files themselves are not exported, they are copied with the storage folder.
+
+Usage: python -m dopi export FILE [--format jsonl|csv] [--checksums]
+       python -m dopi import FILE [--format jsonl|csv] [--on-conflict replace|skip]
+"""
+
+import csv
+import json
+import ntpath
+import os
+import sys
+from collections import defaultdict, namedtuple
+
+from dopi.cache import file_hash
+from dopi.storage import is_blob_name, release_blob, stored_path
+
+CHUNK_SIZE = 500
+FORMATS = ["jsonl", "csv"]
+# Documents whose name already exists are replaced (as "Daten speichern" does after confirming) or kept
+POLICIES = ["replace", "skip"]
+FIELDS = ["name", "keyword1", "keyword2", "date", "blob", "sha256", "pages"]
+
+TransferResult = namedtuple("TransferResult", "imported skipped errors")
+
+
+# Format of a file by its extension, JSON Lines unless it ends with .csv
+def file_format(path):
+    return "csv" if path.lower().endswith(".csv") else "jsonl"
+
+
+# Records of all documents in the order of saving. The export runs in one read transaction, documents saved by
+# other instances in the meantime are not seen half way. With checksums missing SHA-256 are computed from the files.
+def iter_records(database, checksums=False):
+    connection = database.connection()
+    connection.execute("BEGIN")
+    try:
+        documents = connection.cursor()
+        documents.execute("SELECT id, name, keyword1, keyword2, date, blob, sha256 FROM documents ORDER BY id")
+        pages = connection.cursor()
+        while chunk := documents.fetchmany(CHUNK_SIZE):
+            texts = defaultdict(list)
+            pages.execute("SELECT document_id, text FROM pages WHERE document_id BETWEEN ? AND ? "
+                          "ORDER BY document_id, page_no", (chunk[0][0], chunk[-1][0]))
+            for document_id, text in pages:
+                texts[document_id].append(text or "")
+            for document_id, name, keyword1, keyword2, date, blob, sha256 in chunk:
+                if checksums and sha256 is None:
+                    path = stored_path(database.folder, name, blob)
+                    sha256 = file_hash(path) if os.path.isfile(path) else None
+                yield {"name": name, "keyword1": keyword1 or "", "keyword2": keyword2 or "", "date": date or "",
+                       "blob": blob, "sha256": sha256, "pages": texts[document_id]}
+    finally:
+        connection.rollback()
+
+
+# Write all documents to the file ("-" for the standard output), returns the number of documents.
+# progress(documents) is called after every chunk.
+def export_catalogue(database, path, output_format=None, checksums=False, progress=None):
+    output_format = output_format or file_format(path)
+    output = sys.stdout if path == "-" else open(path, "w", encoding="utf-8", newline="")
+    exported = 0
+    try:
+        writer = csv.DictWriter(output, FIELDS) if output_format == "csv" else None
+        if writer:
+            writer.writeheader()
+        for record in iter_records(database, checksums):
+            if writer:
+                writer.writerow({**record, "pages": json.dumps(record["pages"], ensure_ascii=False)})
+            else:
+                output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            exported += 1
+            if progress and exported % CHUNK_SIZE == 0:
+                progress(exported)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+    if progress:
+        progress(exported)
+    return exported
+
+
+# Records of an exported file as (line, record), a record that cannot be read as (line, error)
+def read_records(source, input_format):
+    if input_format == "csv":
+        # Page texts easily exceed the default limit of a CSV field
+        csv.field_size_limit(2 ** 31 - 1)
+        reader = csv.DictReader(source)
+        for record in reader:
+            try:
+                record["pages"] = json.loads(record.get("pages") or "[]")
+                yield reader.line_num, record
+            except ValueError as e:
+                yield reader.line_num, e
+    else:
+        for line, text in enumerate(source, start=1):
+            if text.strip():
+                try:
+                    yield line, json.loads(text)
+                except ValueError as e:
+                    yield line, e
+
+
+# Is the name a file name without folder or drive on every system: "C:rechnung.pdf" is relative to the current
+# folder of drive C on Windows, a colon also names an alternate data stream there
+def _plain_name(name):
+    return (name not in (".", "..") and ":" not in name and not ntpath.splitdrive(name)[0]
+            and ntpath.basename(name) == name and os.path.basename(name) == name)
+
+
+# Row for Database.upsert_many. Name and blob become paths in the storage folder (files are opened and removed
+# there), so a name must be a plain file name and a blob a path in the form of dopi.storage.blob_name.
+def document_row(record):
+    if not isinstance(record, dict) or not record.get("name"):
+        raise ValueError("Name fehlt")
+    name = str(record["name"])
+    if not _plain_name(name):
+        raise ValueError(f"Ungültiger Name: {name}")
+    blob = record.get("blob") or None
+    if blob is not None and not (isinstance(blob, str) and is_blob_name(blob)):
+        raise ValueError(f"Ungültige Ablage: {blob}")
+    pages = record.get("pages") or []
+    if not isinstance(pages, list):
+        raise ValueError("Seiten sind keine Liste")
+    return (name, record.get("keyword1") or "", record.get("keyword2") or "", record.get("date") or "",
+            [str(text) for text in pages], record.get("sha256") or None, blob)
+
+
+# Save the documents of the file ("-" for the standard input) in chunks. Existing documents are replaced or kept
+# according to the policy, files of replaced documents are released like in the GUI. Records that cannot be read
+# are reported as (line, error). progress(documents) is called after every chunk.
+def import_catalogue(database, path, input_format=None, policy="replace", progress=None):
+    input_format = input_format or file_format(path)
+    source = sys.stdin if path == "-" else open(path, encoding="utf-8", newline="")
+    rows, errors = [], []
+    imported = skipped = 0
+
+    def write():
+        nonlocal rows, imported, skipped
+        rows = list({row[0]: row for row in rows}.values())
+        existing = database.existing_names([row[0] for row in rows])
+        if policy == "skip":
+            skipped += len(existing)
+            rows = [row for row in rows if row[0] not in existing]
+        replaced = [database.blob(row[0]) for row in rows if row[0] in existing]
+        database.upsert_many(rows)
+        for blob in set(replaced) - {row[6] for row in rows}:
+            release_blob(database, blob)
+        imported += len(rows)
+        rows = []
+        if progress:
+            progress(imported + skipped)
+
+    try:
+        for line, record in read_records(source, input_format):
+            try:
+                if isinstance(record, Exception):
+                    raise record
+                rows.append(document_row(record))
+            except ValueError as e:
+                errors.append((line, e))
+            if len(rows) >= CHUNK_SIZE:
+                write()
+        if rows:
+            write()
+    finally:
+        if source is not sys.stdin:
+            source.close()
+    return TransferResult(imported, skipped, errors)
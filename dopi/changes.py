@@ -0,0 +1,33 @@
+"""
+Change detection for several DOPI instances sharing a storage folder.
+
+PRAGMA data_version changes whenever another connection (another instance or a background thread) commits. It is
+polled cheaply, only after a change the change log (table changes, filled by triggers) is read to find the
+documents whose rows have to be refreshed.
+"""
+
+
+class ChangeMonitor:
+    def __init__(self, database):
+        self.database = database  # dopi.database.Database, polled on the thread that calls poll()
+        self._path = None
+        self._version = None
+        self._seq = None
+
+    # Ids of the documents changed by other connections since the last call. An empty set if nothing changed,
+    # None if the change log does not reach back far enough and everything has to be reloaded.
+    def poll(self):
+        database = self.database
+        if self._path != database.path:
+            # New storage folder, the caller loads its list anyway
+            self._version = database.data_version()
+            self._seq = database.last_change()
+            self._path = database.path
+            return set()
+        version = database.data_version()
+        if version == self._version:
+            return set()
+        self._version = version
+        database.query_cache.invalidate()
+        self._seq, document_ids = database.changes_since(self._seq)
+        return document_ids
@@ -0,0 +1,208 @@
+"""
+Command line interface, works without Tk.
+
+    python -m dopi ingest FOLDER [--move] [--workers N]
+    python -m dopi search TERM... [--limit N]
+    python -m dopi reindex [--index-only] [--workers N]
+    python -m dopi watch [FOLDER...] [--move] [--workers N] [--interval SECONDS]
+    python -m dopi migrate-storage
+    python -m dopi verify
+    python -m dopi export FILE [--format jsonl|csv] [--checksums]
+    python -m dopi import FILE [--format jsonl|csv] [--on-conflict replace|skip]
+    python -m dopi import --from-storage [--workers N]
+
+Every command takes --storage PATH, by default the storage path from config.json is used. Modules are imported by
+the command that needs them, so a search does not load the OCR and PDF libraries.
+"""
+
+import argparse
+import sys
+
+from dopi.config import load_config
+
+
+def progress(done, total, errors, rate):
+    print(f"\r{done}/{total} Dateien, {errors} Fehler, {rate:.1f} Dateien/s", end="", file=sys.stderr)
+
+
+# Errors, duplicates and throughput of an import or reindex run, the exit code is 1 if files failed
+def report(result, action):
+    print(file=sys.stderr)
+    for path, error in result.errors:
+        print(f"Fehler: {path}: {error}", file=sys.stderr)
+    for path, duplicate in result.duplicates:
+        print(f"Duplikat: {path} hat denselben Inhalt wie '{duplicate}'", file=sys.stderr)
+    rate = result.total / result.seconds if result.seconds else 0
+    print(f"{result.imported} von {result.total} Dateien {action} in {result.seconds:.1f} s ({rate:.1f} Dateien/s)")
+    return 1 if result.errors else 0
+
+
+def ingest(database, args):
+    from dopi.ingest import ingest_folder
+
+    result = ingest_folder(database, args.folder, "Move" if args.move else "Copy", args.workers, progress=progress)
+    return report(result, "importiert")
+
+
+def search(database, args):
+    from dopi.search import FIRST_PAGE
+
+    rows, key = [], FIRST_PAGE
+    while len(rows) < args.limit:
+        page, key = database.search_page(args.terms, key, args.limit - len(rows))
+        if not page:
+            break
+        rows.extend(page)
+    for _, name, keyword1, keyword2, date, preview, page_no in rows:
+        print("\t".join([name, keyword1, keyword2, date, f"S. {page_no or 1}", (preview or "")[:80]]))
+    return 0 if rows else 1
+
+
+def reindex(database, args):
+    if args.index_only:
+        database.rebuild_index()
+        return 0
+    from dopi.ingest import reindex_storage
+
+    result = reindex_storage(database, args.workers, progress=progress)
+    database.rebuild_index()
+    return report(result, "neu eingelesen")
+
+
+def watch(database, args):
+    from dopi.watch import Watcher
+
+    folders = args.folders or load_config().get("Inbox folders", [])
+    if not folders:
+        print("Keine Eingangsordner angegeben", file=sys.stderr)
+        return 2
+    watcher = Watcher(database, folders, "Move" if args.move else "Copy", args.workers, args.interval,
+                      log=lambda text: print(text, flush=True))
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def migrate_storage(database, args):
+    from dopi.storage import migrate_to_hashed
+
+    missing = migrate_to_hashed(database, lambda done, total: print(f"\r{done}/{total} Dokumente", end="",
+                                                                     file=sys.stderr))
+    print(file=sys.stderr)
+    for name in missing:
+        print(f"Datei fehlt: {name}", file=sys.stderr)
+    print('Der Speicherpfad verwendet jetzt die Ablage nach Inhalt ("Storage layout": "hashed").')
+    return 1 if missing else 0
+
+
+def verify(database, args):
+    from dopi.storage import verify_archive
+
+    problems = verify_archive(database, lambda done, total: print(f"\r{done}/{total} Dokumente", end="",
+                                                                   file=sys.stderr))
+    print(file=sys.stderr)
+    for name, problem in problems:
+        print(f"{problem}: {name}")
+    return 1 if problems else 0
+
+
+def export(database, args):
+    from dopi.catalogue import export_catalogue
+
+    exported = export_catalogue(database, args.file, args.format, args.checksums,
+                                lambda documents: print(f"\r{documents} Dokumente", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    print(f"{exported} Dokumente exportiert", file=sys.stderr)
+    return 0
+
+
+def import_(database, args):
+    if args.from_storage:
+        from dopi.ingest import rebuild_catalogue
+
+        return report(rebuild_catalogue(database, args.workers, progress=progress), "in den Katalog aufgenommen")
+    if not args.file:
+        print("Keine Datei angegeben", file=sys.stderr)
+        return 2
+    from dopi.catalogue import import_catalogue
+
+    result = import_catalogue(database, args.file, args.format, args.on_conflict,
+                              lambda documents: print(f"\r{documents} Dokumente", end="", file=sys.stderr))
+    print(file=sys.stderr)
+    for line, error in result.errors:
+        print(f"Fehler in Zeile {line}: {error}", file=sys.stderr)
+    print(f"{result.imported} Dokumente importiert, {result.skipped} vorhandene übersprungen", file=sys.stderr)
+    return 1 if result.errors else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m dopi", description="DOPI ohne Oberfläche verwenden.")
+    storage = argparse.ArgumentParser(add_help=False)
+    storage.add_argument("--storage", help="Speicherpfad (Standard: Speicherpfad aus config.json)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("ingest", parents=[storage],
+                                  help="Alle PDF- und Bilddateien eines Ordners importieren")
+    command.add_argument("folder", help="Ordner mit den zu importierenden Dateien")
+    command.add_argument("--move", action="store_true", help="Dateien verschieben statt kopieren")
+    command.add_argument("--workers", type=int, help="Anzahl der Prozesse (Standard: Anzahl der Kerne)")
+    command.set_defaults(run=ingest)
+
+    command = commands.add_parser("search", parents=[storage], help="Dokumente suchen, beste Treffer zuerst")
+    command.add_argument("terms", nargs="+", help="Suchbegriffe, alle müssen vorkommen")
+    command.add_argument("--limit", type=int, default=20, help="Höchstzahl der Treffer (Standard: 20)")
+    command.set_defaults(run=search)
+
+    command = commands.add_parser("reindex", parents=[storage],
+                                  help="Text aller archivierten Dateien neu einlesen und den Suchindex neu aufbauen")
+    command.add_argument("--index-only", action="store_true", help="Nur den Suchindex neu aufbauen")
+    command.add_argument("--workers", type=int, help="Anzahl der Prozesse (Standard: Anzahl der Kerne)")
+    command.set_defaults(run=reindex)
+
+    command = commands.add_parser("watch", parents=[storage],
+                                  help="Eingangsordner überwachen und neue oder geänderte Dateien importieren")
+    command.add_argument("folders", nargs="*", help="Eingangsordner (Standard: Inbox folders aus config.json)")
+    command.add_argument("--move", action="store_true", help="Dateien verschieben statt kopieren")
+    command.add_argument("--workers", type=int, help="Anzahl der Prozesse (Standard: Anzahl der Kerne)")
+    command.add_argument("--interval", type=float, default=5, help="Sekunden zwischen zwei Durchläufen")
+    command.set_defaults(run=watch)
+
+    command = commands.add_parser("migrate-storage", parents=[storage],
+                                  help="Dateien des Speicherpfads in die Ablage nach Inhalt verschieben")
+    command.set_defaults(run=migrate_storage)
+
+    command = commands.add_parser("verify", parents=[storage],
+                                  help="Archivierte Dateien mit ihren Prüfsummen vergleichen")
+    command.set_defaults(run=verify)
+
+    command = commands.add_parser("export", parents=[storage],
+                                  help="Katalog mit Seitentexten als JSON Lines oder CSV exportieren")
+    command.add_argument("file", help="Zieldatei, - für die Standardausgabe")
+    command.add_argument("--format", choices=["jsonl", "csv"], help="Format (Standard: nach Dateiendung)")
+    command.add_argument("--checksums", action="store_true",
+                         help="Fehlende Prüfsummen aus den archivierten Dateien berechnen")
+    command.set_defaults(run=export)
+
+    command = commands.add_parser("import", parents=[storage],
+                                  help="Exportierten Katalog importieren oder aus dem Speicherpfad wiederherstellen")
+    command.add_argument("file", nargs="?", help="Exportierte Datei, - für die Standardeingabe")
+    command.add_argument("--format", choices=["jsonl", "csv"], help="Format (Standard: nach Dateiendung)")
+    command.add_argument("--on-conflict", choices=["replace", "skip"], default="replace",
+                         help="Vorhandene Dokumente ersetzen (Standard) oder behalten")
+    command.add_argument("--from-storage", action="store_true",
+                         help="Dokumente für alle Dateien des Speicherpfads ohne Katalogeintrag anlegen")
+    command.add_argument("--workers", type=int, help="Anzahl der Prozesse (Standard: Anzahl der Kerne)")
+    command.set_defaults(run=import_)
+
+    args = parser.parse_args(argv)
+    folder = args.storage or load_config().get("Storage path")
+    if not folder:
+        parser.error("Kein Speicherpfad gesetzt")
+
+    from dopi.database import Database
+
+    database = Database(folder)
+    database.create()
+    return args.run(database, args)
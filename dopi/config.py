@@ -0,0 +1,23 @@
+"""
+Configuration file of DOPI (config.json in the working directory).
+"""
+
+import json
+import os
+
+CONFIG_FILE = "config.json"
+
+
+def load_config():
+    if os.path.exists(CONFIG_FILE):
+        with open(CONFIG_FILE, "r") as jsonfile:
+            return json.load(jsonfile)
+    return {}
+
+
+# Update the given settings and keep all others
+def save_config(**settings):
+    data = load_config()
+    data.update(settings)
+    with open(CONFIG_FILE, "w") as jsonfile:
+        json.dump(data, jsonfile)
@@ -0,0 +1,549 @@
+"""
+Database layer of DOPI.
+
+Every thread gets one long-lived, configured connection to DOPI.db in the storage folder. The connection is
+reopened transparently when the storage folder changes.
+
+Several DOPI instances may share a storage folder. Every write is a short immediate transaction that waits for the
+lock and is retried with backoff while another instance holds it. The journal mode is set with "Journal mode" in
+config.json and has to be the same for all instances:
+- WAL (default): reads never wait for a writer. Needs shared memory between the processes, so all instances have
+  to run on the computer that holds the storage folder.
+- DELETE: for a storage folder on a network share used by several computers. Reads wait while a write transaction
+  commits (at most BUSY_TIMEOUT), the short write transactions keep these waits short.
+"""
+
+import os
+import random
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+from dopi.config import load_config
+from dopi.metrics import count, timed, timer
+from dopi.search import LIST_COLUMNS, NO_FILTERS, QueryCache, filter_conditions, list_page
+
+DB_NAME = "DOPI.db"
+
+JOURNAL_MODE = "WAL"
+JOURNAL_MODES = ("WAL", "DELETE")
+CACHED_STATEMENTS = 256
+CACHE_SIZE_KIB = 64 * 1024
+MMAP_SIZE = 256 * 1024 * 1024
+# Seconds a statement waits for a lock held by another connection
+BUSY_TIMEOUT = 5
+# A write transaction that still finds the database locked is retried with exponential backoff
+WRITE_RETRIES = 4
+RETRY_DELAY = 0.05
+# Seconds a claim on a blob is valid, claims of an instance that crashed before saving its documents expire
+CLAIM_SECONDS = 24 * 60 * 60
+
+SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS documents (
+        id INTEGER PRIMARY KEY,
+        name TEXT UNIQUE,
+        keyword1 TEXT,
+        keyword2 TEXT,
+        date TEXT,
+        content TEXT)
+    '''
+
+# Schema changes, MIGRATIONS[n] brings a database from version n (PRAGMA user_version) to n + 1
+MIGRATIONS = [
+    # Full-text index over all searchable columns, kept in sync with the table by triggers
+    '''
+    CREATE VIRTUAL TABLE documents_fts USING fts5(
+        name, keyword1, keyword2, date, content,
+        content='documents', content_rowid='id', tokenize='unicode61 remove_diacritics 0', prefix='2 3');
+    CREATE TRIGGER documents_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts (rowid, name, keyword1, keyword2, date, content)
+        VALUES (new.id, new.name, new.keyword1, new.keyword2, new.date, new.content);
+    END;
+    CREATE TRIGGER documents_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, name, keyword1, keyword2, date, content)
+        VALUES ('delete', old.id, old.name, old.keyword1, old.keyword2, old.date, old.content);
+    END;
+    CREATE TRIGGER documents_au AFTER UPDATE ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, name, keyword1, keyword2, date, content)
+        VALUES ('delete', old.id, old.name, old.keyword1, old.keyword2, old.date, old.content);
+        INSERT INTO documents_fts (rowid, name, keyword1, keyword2, date, content)
+        VALUES (new.id, new.name, new.keyword1, new.keyword2, new.date, new.content);
+    END;
+    INSERT INTO documents_fts (documents_fts) VALUES ('rebuild');
+    ''',
+    # SHA-256 of the file content for duplicate detection
+    '''
+    ALTER TABLE documents ADD COLUMN sha256 TEXT;
+    CREATE INDEX documents_sha256 ON documents (sha256);
+    ''',
+    # The text is stored page by page. Page boundaries of existing documents are unknown, their content
+    # becomes page 1. The full-text index is split into the metadata and the pages.
+    '''
+    CREATE TABLE pages (
+        id INTEGER PRIMARY KEY,
+        document_id INTEGER NOT NULL,
+        page_no INTEGER NOT NULL,
+        text TEXT,
+        UNIQUE (document_id, page_no));
+    INSERT INTO pages (document_id, page_no, text)
+    SELECT id, 1, content FROM documents WHERE content IS NOT NULL AND content != '';
+
+    DROP TRIGGER documents_ai;
+    DROP TRIGGER documents_ad;
+    DROP TRIGGER documents_au;
+    DROP TABLE documents_fts;
+    ALTER TABLE documents DROP COLUMN content;
+
+    CREATE VIRTUAL TABLE documents_fts USING fts5(
+        name, keyword1, keyword2, date,
+        content='documents', content_rowid='id', tokenize='unicode61 remove_diacritics 0', prefix='2 3');
+    CREATE TRIGGER documents_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO documents_fts (rowid, name, keyword1, keyword2, date)
+        VALUES (new.id, new.name, new.keyword1, new.keyword2, new.date);
+    END;
+    CREATE TRIGGER documents_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, name, keyword1, keyword2, date)
+        VALUES ('delete', old.id, old.name, old.keyword1, old.keyword2, old.date);
+        DELETE FROM pages WHERE document_id = old.id;
+    END;
+    CREATE TRIGGER documents_au AFTER UPDATE ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, name, keyword1, keyword2, date)
+        VALUES ('delete', old.id, old.name, old.keyword1, old.keyword2, old.date);
+        INSERT INTO documents_fts (rowid, name, keyword1, keyword2, date)
+        VALUES (new.id, new.name, new.keyword1, new.keyword2, new.date);
+    END;
+
+    CREATE VIRTUAL TABLE pages_fts USING fts5(
+        text, content='pages', content_rowid='id', tokenize='unicode61 remove_diacritics 0', prefix='2 3');
+    CREATE TRIGGER pages_ai AFTER INSERT ON pages BEGIN
+        INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+    END;
+    CREATE TRIGGER pages_ad AFTER DELETE ON pages BEGIN
+        INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    END;
+    CREATE TRIGGER pages_au AFTER UPDATE ON pages BEGIN
+        INSERT INTO pages_fts (pages_fts, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO pages_fts (rowid, text) VALUES (new.id, new.text);
+    END;
+
+    INSERT INTO documents_fts (documents_fts) VALUES ('rebuild');
+    INSERT INTO pages_fts (pages_fts) VALUES ('rebuild');
+    ''',
+    # Files of the watched inbox folders that were already processed, see dopi.watch
+    '''
+    CREATE TABLE inbox_files (
+        path TEXT PRIMARY KEY,
+        size INTEGER NOT NULL,
+        mtime_ns INTEGER NOT NULL,
+        sha256 TEXT);
+    ''',
+    # The overview shows a one-line snippet that is stored with the document, so the list never reads page texts.
+    # The full-text index is only updated when an indexed column changes.
+    '''
+    DROP TRIGGER documents_au;
+    CREATE TRIGGER documents_au AFTER UPDATE OF name, keyword1, keyword2, date ON documents BEGIN
+        INSERT INTO documents_fts (documents_fts, rowid, name, keyword1, keyword2, date)
+        VALUES ('delete', old.id, old.name, old.keyword1, old.keyword2, old.date);
+        INSERT INTO documents_fts (rowid, name, keyword1, keyword2, date)
+        VALUES (new.id, new.name, new.keyword1, new.keyword2, new.date);
+    END;
+    ALTER TABLE documents ADD COLUMN snippet TEXT NOT NULL DEFAULT '';
+    UPDATE documents SET snippet = ifnull((SELECT replace(substr(text, 1, 300), char(10), '') FROM pages
+                                           WHERE document_id = documents.id AND page_no = 1), '');
+    ''',
+    # File of the document in the hashed storage layout (see dopi.storage), NULL in the flat layout
+    '''
+    ALTER TABLE documents ADD COLUMN blob TEXT;
+    CREATE INDEX documents_blob ON documents (blob);
+    ''',
+    # The date as ISO date for ranges and sorting, '' if the entered date is not valid. The keyword indexes
+    # answer exact keywords with or without a date range and the keyword counts.
+    '''
+    ALTER TABLE documents ADD COLUMN iso_date TEXT NOT NULL DEFAULT '';
+    UPDATE documents SET iso_date = iso_date(date);
+    CREATE INDEX documents_iso_date ON documents (iso_date);
+    CREATE INDEX documents_keyword1 ON documents (keyword1, iso_date);
+    CREATE INDEX documents_keyword2 ON documents (keyword2, iso_date);
+    ''',
+    # Log of the changed documents, other instances refresh only these rows (see dopi.changes). The last 10000
+    # entries are kept, an instance that fell further behind reloads its list.
+    '''
+    CREATE TABLE changes (
+        seq INTEGER PRIMARY KEY,
+        document_id INTEGER NOT NULL);
+    CREATE TRIGGER changes_ai AFTER INSERT ON documents BEGIN
+        INSERT INTO changes (document_id) VALUES (new.id);
+        DELETE FROM changes WHERE seq <= last_insert_rowid() - 10000;
+    END;
+    CREATE TRIGGER changes_au AFTER UPDATE OF name, keyword1, keyword2, date, snippet ON documents BEGIN
+        INSERT INTO changes (document_id) VALUES (new.id);
+        DELETE FROM changes WHERE seq <= last_insert_rowid() - 10000;
+    END;
+    CREATE TRIGGER changes_ad AFTER DELETE ON documents BEGIN
+        INSERT INTO changes (document_id) VALUES (old.id);
+        DELETE FROM changes WHERE seq <= last_insert_rowid() - 10000;
+    END;
+    ''',
+    # Blobs that were archived for documents that are not saved yet (see dopi.storage.archive_file). A claim counts
+    # as a reference, so release_blob does not remove the blob in the meantime.
+    '''
+    CREATE TABLE blob_claims (
+        id INTEGER PRIMARY KEY,
+        blob TEXT NOT NULL,
+        expires REAL NOT NULL);
+    CREATE INDEX blob_claims_blob ON blob_claims (blob);
+    ''',
+]
+
+# If a document with the name already exists, its data is overwritten
+UPSERT = '''
+    INSERT INTO documents (name, keyword1, keyword2, date, iso_date, sha256, blob, snippet)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(name) DO UPDATE SET
+        keyword1 = excluded.keyword1,
+        keyword2 = excluded.keyword2,
+        date = excluded.date,
+        iso_date = excluded.iso_date,
+        sha256 = excluded.sha256,
+        blob = excluded.blob,
+        snippet = excluded.snippet
+    '''
+DELETE_PAGES = "DELETE FROM pages WHERE document_id = (SELECT id FROM documents WHERE name = ?)"
+INSERT_PAGE = "INSERT INTO pages (document_id, page_no, text) SELECT id, ?, ? FROM documents WHERE name = ?"
+REBUILD_INDEX = '''
+    BEGIN IMMEDIATE;
+    INSERT INTO documents_fts (documents_fts) VALUES ('rebuild');
+    INSERT INTO pages_fts (pages_fts) VALUES ('rebuild');
+    INSERT INTO documents_fts (documents_fts) VALUES ('optimize');
+    INSERT INTO pages_fts (pages_fts) VALUES ('optimize');
+    COMMIT;
+    '''
+
+# Number of documents per keyword, a document with the same keyword twice counts once
+KEYWORD_COUNTS = '''
+    SELECT keyword, sum(number) FROM (
+        SELECT keyword1 AS keyword, count(*) AS number FROM documents
+        WHERE keyword1 != ''{conditions} GROUP BY keyword1
+        UNION ALL
+        SELECT keyword2, count(*) FROM documents
+        WHERE keyword2 != '' AND keyword2 IS NOT keyword1{conditions} GROUP BY keyword2)
+    GROUP BY keyword ORDER BY sum(number) DESC, keyword
+    '''
+
+# Accepted input formats of the date, the first one is the format of the entry field
+DATE_FORMATS = ["%d.%m.%Y", "%d.%m.%y", "%Y-%m-%d"]
+
+# Length of the snippet shown in the overview
+SNIPPET_CHARS = 300
+
+
+# One-line snippet of the first page
+def snippet(pages):
+    return pages[0][:SNIPPET_CHARS].replace("\n", "") if pages else ""
+
+
+# Entered date as ISO date (JJJJ-MM-TT), '' if it is empty or not a valid date
+def iso_date(date):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime((date or "").strip(), date_format).date().isoformat()
+        except ValueError:
+            pass
+    return ""
+
+
+# Statements of an SQL script, for scripts that have to run inside a transaction
+def statements(script):
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            yield statement
+            statement = ""
+
+
+# Is the error caused by a lock of another connection
+def is_locked(error):
+    message = str(error)
+    return "locked" in message or "busy" in message
+
+
+# Run write(connection) in an immediate transaction and return its result. The write lock is taken at the start,
+# so the transaction cannot fail half way because another instance writes. While the database stays locked
+# beyond the busy timeout the whole transaction is retried after a growing, randomised delay.
+def write_transaction(connection, write):
+    for attempt in range(WRITE_RETRIES + 1):
+        try:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                result = write(connection)
+                connection.commit()
+            except BaseException:
+                connection.rollback()
+                raise
+            return result
+        except sqlite3.OperationalError as error:
+            if not is_locked(error) or attempt == WRITE_RETRIES:
+                raise
+            count("sql.retry")
+            time.sleep(RETRY_DELAY * 2 ** attempt * (1 + random.random()))
+
+
+# Journal mode configured in config.json ("Journal mode"), see the description of the module
+def configured_journal_mode():
+    mode = str(load_config().get("Journal mode", JOURNAL_MODE)).upper()
+    return mode if mode in JOURNAL_MODES else JOURNAL_MODE
+
+
+# Open a connection with the settings used throughout DOPI
+def connect(path, journal_mode=JOURNAL_MODE):
+    connection = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=CACHED_STATEMENTS)
+    connection.create_function("iso_date", 1, iso_date, deterministic=True)
+    connection.execute(f"PRAGMA journal_mode = {journal_mode}")
+    connection.execute("PRAGMA synchronous = NORMAL")
+    connection.execute(f"PRAGMA cache_size = -{CACHE_SIZE_KIB}")
+    connection.execute(f"PRAGMA mmap_size = {MMAP_SIZE}")
+    return connection
+
+
+# Apply the next migration, False if the database is up to date. The version is read while the write lock is
+# held, another instance may have migrated in the meantime.
+def migrate(connection):
+    version = connection.execute("PRAGMA user_version").fetchone()[0]
+    if version >= len(MIGRATIONS):
+        return False
+    for statement in statements(MIGRATIONS[version]):
+        connection.execute(statement)
+    connection.execute(f"PRAGMA user_version = {version + 1}")
+    return True
+
+
+class Database:
+    def __init__(self, folder="", journal_mode=None):
+        self.folder = folder  # Storage folder, may be changed at any time
+        self.journal_mode = journal_mode or configured_journal_mode()  # Also used for the extraction cache
+        self._local = threading.local()
+        self.query_cache = QueryCache()  # Search results, invalidated by every change of the documents
+
+    @property
+    def path(self):
+        return os.path.join(self.folder, DB_NAME)
+
+    # Connection of the calling thread
+    def connection(self):
+        local = self._local
+        path = self.path
+        previous = getattr(local, "path", None)
+        if previous != path:
+            self.close()
+            local.connection = connect(path, self.journal_mode)
+            local.path = path
+            # Results of another storage folder are stale. The first connection of a new thread changes nothing.
+            if previous is not None:
+                self.query_cache.invalidate()
+        return local.connection
+
+    # Close the connection of the calling thread
+    def close(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+        self._local.connection = None
+        self._local.path = None
+
+    # Initialisation of the database
+    def create(self):
+        connection = self.connection()
+        connection.executescript(SCHEMA)
+        # Existing databases are migrated once, every step in its own transaction
+        while write_transaction(connection, migrate):
+            pass
+
+    @timed("sql.find_by_name")
+    def find_by_name(self, name):
+        return self.connection().execute("SELECT * FROM documents WHERE name = ?", (name,)).fetchone()
+
+    # Name of a document with the same file content
+    @timed("sql.find_by_hash")
+    def find_by_hash(self, sha256):
+        row = self.connection().execute("SELECT name FROM documents WHERE sha256 = ? LIMIT 1", (sha256,)).fetchone()
+        return row[0] if row else None
+
+    # Names of the given ones that exist
+    def existing_names(self, names):
+        names = list(names)
+        existing = set()
+        for start in range(0, len(names), 500):
+            batch = names[start:start + 500]
+            existing.update(row[0] for row in self.connection().execute(
+                f"SELECT name FROM documents WHERE name IN ({', '.join('?' * len(batch))})", batch))
+        return existing
+
+    # Insert and update data (Upsert (Update or Insert)), pages is the list of page texts
+    def upsert(self, name, keyword1, keyword2, date, pages, sha256=None, blob=None, claims=()):
+        self.upsert_many([(name, keyword1, keyword2, date, pages, sha256, blob)], claims)
+
+    # Upsert of many documents in a single transaction, rows are (name, keyword1, keyword2, date, pages, sha256,
+    # blob). The pages of an existing document are replaced, of several rows with the same name the last one is kept.
+    # The claims on the blobs of the rows (see claim_blob) are dropped in the same transaction.
+    @timed("sql.upsert")
+    def upsert_many(self, rows, claims=()):
+        rows = list({row[0]: row for row in rows}.values())
+        documents = [(name, keyword1, keyword2, date, iso_date(date), sha256, blob, snippet(pages))
+                     for name, keyword1, keyword2, date, pages, sha256, blob in rows]
+
+        def write(connection):
+            connection.executemany(UPSERT, documents)
+            connection.executemany(DELETE_PAGES, [(row[0],) for row in rows])
+            connection.executemany(INSERT_PAGE, [(page_no, text, row[0]) for row in rows
+                                                 for page_no, text in enumerate(row[4], start=1)])
+            connection.executemany("DELETE FROM blob_claims WHERE id = ?", [(claim,) for claim in claims])
+        write_transaction(self.connection(), write)
+        self.query_cache.invalidate()
+
+    @timed("sql.delete")
+    def delete(self, name):
+        write_transaction(self.connection(), lambda connection: connection.execute(
+            "DELETE FROM documents WHERE name = ?", (name,)))
+        self.query_cache.invalidate()
+
+    # Rebuild the full-text indexes from the tables and merge their segments
+    def rebuild_index(self):
+        self.connection().executescript(REBUILD_INDEX)
+
+    # Known files of the inbox folders as {path: (size, mtime_ns, sha256)}
+    def inbox_state(self):
+        return {row[0]: row[1:] for row in self.connection().execute("SELECT * FROM inbox_files")}
+
+    # Record processed inbox files, rows are (path, size, mtime_ns, sha256), and forget files that are gone
+    def update_inbox_state(self, rows, removed=()):
+        def write(connection):
+            connection.executemany("INSERT OR REPLACE INTO inbox_files VALUES (?, ?, ?, ?)", rows)
+            connection.executemany("DELETE FROM inbox_files WHERE path = ?", [(path,) for path in removed])
+        write_transaction(self.connection(), write)
+
+    # Name, keywords, date and blob of all documents
+    def all_details(self):
+        return self.connection().execute("SELECT name, keyword1, keyword2, date, blob FROM documents "
+                                         "ORDER BY id").fetchall()
+
+    # Name and blob of a document, see dopi.storage
+    def stored_file(self, document_id):
+        return self.connection().execute("SELECT name, blob FROM documents WHERE id = ?", (document_id,)).fetchone()
+
+    # Name, blob and checksum of a document, for the preview
+    def file_details(self, document_id):
+        return self.connection().execute("SELECT name, blob, sha256 FROM documents WHERE id = ?",
+                                         (document_id,)).fetchone()
+
+    # Keywords, date and blob of the document with the name, None if it does not exist
+    def metadata(self, name):
+        return self.connection().execute("SELECT keyword1, keyword2, date, blob FROM documents WHERE name = ?",
+                                         (name,)).fetchone()
+
+    # Blob of the document with the name, None if it does not exist or is stored in the flat layout
+    def blob(self, name):
+        row = self.connection().execute("SELECT blob FROM documents WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    # Number of documents stored in the blob and of valid claims on it
+    def blob_references(self, blob):
+        return self.connection().execute("SELECT (SELECT count(*) FROM documents WHERE blob = ?) + "
+                                         "(SELECT count(*) FROM blob_claims WHERE blob = ? AND expires > ?)",
+                                         (blob, blob, time.time())).fetchone()[0]
+
+    # Claim the blob for a document that is saved later, returns the id of the claim. The claim is committed before
+    # the caller looks for the file, see dopi.storage.archive_file. Expired claims are removed on the way.
+    def claim_blob(self, blob):
+        def write(connection):
+            now = time.time()
+            connection.execute("DELETE FROM blob_claims WHERE expires <= ?", (now,))
+            return connection.execute("INSERT INTO blob_claims (blob, expires) VALUES (?, ?)",
+                                      (blob, now + CLAIM_SECONDS)).lastrowid
+        return write_transaction(self.connection(), write)
+
+    # Drop claims whose documents were not saved
+    def drop_claims(self, claims):
+        write_transaction(self.connection(), lambda connection: connection.executemany(
+            "DELETE FROM blob_claims WHERE id = ?", [(claim,) for claim in claims]))
+
+    # Documents stored in the flat layout as (id, name, sha256)
+    def flat_documents(self):
+        return self.connection().execute("SELECT id, name, sha256 FROM documents WHERE blob IS NULL "
+                                         "ORDER BY id").fetchall()
+
+    # Name, blob and checksum of all documents
+    def stored_files(self):
+        return self.connection().execute("SELECT name, blob, sha256 FROM documents ORDER BY id").fetchall()
+
+    def set_blob(self, document_id, blob, sha256, claims=()):
+        def write(connection):
+            connection.execute("UPDATE documents SET blob = ?, sha256 = ? WHERE id = ?", (blob, sha256, document_id))
+            connection.executemany("DELETE FROM blob_claims WHERE id = ?", [(claim,) for claim in claims])
+        write_transaction(self.connection(), write)
+
+    # Name, keywords and date of a document for the popup
+    @timed("sql.details")
+    def details(self, document_id):
+        return self.connection().execute("SELECT name, keyword1, keyword2, date FROM documents WHERE id = ?",
+                                         (document_id,)).fetchall()
+
+    # Page texts of a document in order. Every page is read when it is needed, no cursor is kept open.
+    def pages(self, document_id):
+        page_no = 0
+        while True:
+            with timer("sql.page"):
+                row = self.connection().execute("SELECT page_no, text FROM pages WHERE document_id = ? AND page_no > ? "
+                                                "ORDER BY page_no LIMIT 1", (document_id, page_no)).fetchone()
+            if row is None:
+                return
+            page_no, text = row
+            yield text or ""
+
+    # One page of documents continuing after the given key, see dopi.search
+    @timed("sql.list_page")
+    def list_page(self, key, limit, filters=NO_FILTERS):
+        return list_page(self.connection(), key, limit, filters)
+
+    # One page of search results, see dopi.search
+    @timed("sql.search_page")
+    def search_page(self, search_terms, key, limit, filters=NO_FILTERS):
+        return self.query_cache.search_page(self.connection(), search_terms, key, limit, filters)
+
+    # Keywords with their number of documents in the date range of the filters, most frequent first
+    @timed("sql.keyword_counts")
+    def keyword_counts(self, filters=NO_FILTERS):
+        conditions, parameters = filter_conditions(filters._replace(keyword=None))
+        query = KEYWORD_COUNTS.format(conditions="".join(f" AND {condition}" for condition in conditions))
+        return self.connection().execute(query, parameters * 2).fetchall()
+
+    # Changes whenever another connection committed, a cheap check for changes of other instances
+    def data_version(self):
+        return self.connection().execute("PRAGMA data_version").fetchone()[0]
+
+    # Last entry of the change log
+    def last_change(self):
+        return self.connection().execute("SELECT ifnull(max(seq), 0) FROM changes").fetchone()[0]
+
+    # Documents changed after the given entry of the change log as (last entry, set of ids). The ids are None
+    # if the log no longer reaches back to the entry.
+    def changes_since(self, seq):
+        rows = self.connection().execute("SELECT seq, document_id FROM changes WHERE seq >= ? ORDER BY seq",
+                                         (seq,)).fetchall()
+        if not rows:
+            return (seq, set()) if seq == 0 else (self.last_change(), None)
+        if rows[0][0] > max(seq, 1):
+            return rows[-1][0], None
+        return rows[-1][0], {document_id for entry, document_id in rows if entry > seq}
+
+    # Overview rows of the documents with the given ids, deleted documents are missing. The rows end with the
+    # snippet, the page of a search hit shown in the list is kept by PagedTreeview.update_rows.
+    def list_rows(self, document_ids):
+        document_ids = list(document_ids)
+        rows = []
+        for start in range(0, len(document_ids), 500):
+            batch = document_ids[start:start + 500]
+            rows.extend(self.connection().execute(f"SELECT {LIST_COLUMNS} FROM documents WHERE id IN "
+                                                  f"({', '.join('?' * len(batch))})", batch))
+        return rows
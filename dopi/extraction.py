@@ -0,0 +1,176 @@
+"""
+Text extraction: OCR of images with the bundled Tesseract and text extraction from PDF files.
+
+pypdf is imported on first use, so importing this module stays cheap for the GUI and the command line.
+"""
+
+import os
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from dopi.metrics import count, timer
+from dopi.ocr import get_backend
+from dopi.preprocess import PROFILES, prepare_image, profile_name
+
+IMAGE_EXTENSIONS = (".png", ".jpg")
+PDF_EXTENSIONS = (".pdf",)
+# Pages with fewer extractable characters are treated as scanned pages and run through OCR
+MIN_PAGE_TEXT = 20
+# Scanned pages that are passed to one Tesseract process
+OCR_BATCH = 4
+
+
+# Scan image
+def extract_image(path, profile=None):
+    return extract_images([path], profile)[0]
+
+
+# Scan several images with as few Tesseract processes as possible. The images are prepared according to the
+# OCR profile (see dopi.preprocess), which also chooses the language and the Tesseract modes.
+def extract_images(paths, profile=None, preprocessing=True):
+    profile = PROFILES[profile_name(profile)]
+    if not preprocessing:
+        return get_backend().image_to_string(paths, profile["lang"], profile["config"])
+    with tempfile.TemporaryDirectory() as folder:
+        prepared = []
+        for path in paths:
+            prepared.append(os.path.join(folder, f"{len(prepared)}.png"))
+            prepare_image(path, prepared[-1], profile)
+        return get_backend().image_to_string(prepared, profile["lang"], profile["config"])
+
+
+# Pages of an image as (page number, page count, text), an image has a single page
+def iter_image_pages(path):
+    yield 1, 1, extract_image(path)
+
+
+# Scan embedded images of a PDF. If the batch fails, the images are scanned one by one: an image that cannot be
+# read (broken or unsupported data) gives no text, the other images and the text layer of its page are kept.
+def extract_embedded_images(paths):
+    if len(paths) > 1:
+        try:
+            return extract_images(paths)
+        except Exception:
+            pass
+    texts = []
+    for path in paths:
+        try:
+            texts.append(extract_images([path])[0])
+        except Exception:
+            count("ocr.image_errors")
+            texts.append("")
+    return texts
+
+
+# Scan the embedded images of several PDF pages with one Tesseract process, returns the text of every page
+def extract_page_images(pages):
+    with tempfile.TemporaryDirectory() as folder:
+        paths, owners = [], []
+        for page_index, images in enumerate(pages):
+            for name, data in images:
+                paths.append(os.path.join(folder, f"{len(paths)}{os.path.splitext(name)[1]}"))
+                owners.append(page_index)
+                with open(paths[-1], "wb") as image_file:
+                    image_file.write(data)
+        texts = [[] for _ in pages]
+        for page_index, text in zip(owners, extract_embedded_images(paths)):
+            texts[page_index].append(text)
+    return ["\n".join(page_texts) for page_texts in texts]
+
+
+# Embedded images of a page as (name, data), pages with images in unsupported formats are not scanned
+def page_images(page):
+    try:
+        return [(image.name, image.data) for image in page.images]
+    except Exception:
+        return []
+
+
+# Pages of a PDF as (page number, page count, text) in page order.
+# Pages without a text layer (fewer than MIN_PAGE_TEXT characters) are scanned from their embedded images, a short
+# text layer is kept in front of the recognised text. Up to OCR_BATCH pages are scanned by one Tesseract process
+# and the batches run in parallel: every batch is a separate process, so a thread pool uses all cores. Pages with
+# a text layer are never scanned. An embedded image that cannot be scanned gives no text instead of failing the PDF.
+def iter_pdf_pages(path, ocr_workers=None):
+    from pypdf import PdfReader
+
+    with timer("pdf.open"):
+        reader = PdfReader(path)
+    page_count = len(reader.pages)
+    ocr_workers = ocr_workers or os.cpu_count() or 1
+    executor = ThreadPoolExecutor(max_workers=ocr_workers)
+    # (page number, text or [future of the batch, index in the batch, text layer]), the future is set when the
+    # batch starts
+    pending = deque()
+    batch, batches = [], 0
+
+    def submit_batch():
+        nonlocal batch, batches
+        future = executor.submit(extract_page_images, [images for images, _ in batch])
+        for images, scan in batch:
+            scan[0] = future
+        batch, batches = [], batches + 1
+
+    def ready():
+        result = pending[0][1]
+        return isinstance(result, str) or (result[0] is not None and result[0].done())
+
+    def next_page():
+        nonlocal batches
+        pending_page_no, result = pending.popleft()
+        if not isinstance(result, str):
+            future, index, text = result
+            if index == 0:
+                batches -= 1
+            try:
+                scanned = future.result()[index]
+            except Exception:
+                # The batch failed as a whole, the page keeps its text layer
+                count("ocr.batch_errors")
+                scanned = ""
+            result = "\n".join(part for part in (text.strip(), scanned) if part)
+        return pending_page_no, page_count, result
+
+    try:
+        for page_no, page in enumerate(reader.pages, start=1):
+            with timer("pdf.text"):
+                text = page.extract_text()
+            images = page_images(page) if len(text.strip()) < MIN_PAGE_TEXT else []
+            if images:
+                scan = [None, len(batch), text]
+                batch.append((images, scan))
+                pending.append((page_no, scan))
+                if len(batch) >= OCR_BATCH:
+                    submit_batch()
+            else:
+                pending.append((page_no, text))
+            # Hand out finished pages in order. The image data of queued scans is held in memory, so the
+            # extraction does not run further ahead than two batches per worker.
+            while pending and (ready() or batches >= 2 * ocr_workers):
+                yield next_page()
+        if batch:
+            submit_batch()
+        while pending:
+            yield next_page()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+# Pages of a supported file depending on its extension
+def iter_pages(path, ocr_workers=None):
+    extension = os.path.splitext(path)[1].lower()
+    if extension in IMAGE_EXTENSIONS:
+        return iter_image_pages(path)
+    if extension in PDF_EXTENSIONS:
+        return iter_pdf_pages(path, ocr_workers)
+    raise ValueError(f"Nicht unterstützter Dateityp: {extension}")
+
+
+# Identifies the extraction settings of a file, cached results of other settings are not reused. "merged" marks
+# PDF texts that keep the short text layer of scanned pages.
+def extraction_settings(path, profile=None):
+    ocr = f"tesseract:{profile_name(profile)}"
+    if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+        return ocr
+    return f"pypdf+{ocr}:{MIN_PAGE_TEXT}:merged"
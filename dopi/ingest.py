@@ -0,0 +1,262 @@
+"""
+Batch import of whole folders.
+
+Text extraction is spread over a process pool with one worker per core, images are scanned in batches by a single
+Tesseract process. The results are written to the database with executemany in chunked transactions. Files that
+cannot be read are reported and skipped.
+
+Usage: python -m dopi ingest FOLDER [--storage PATH] [--move] [--workers N]
+"""
+
+import os
+import sys
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from dopi.cache import ExtractionCache, cache_key, file_hash
+from dopi.database import Database
+from dopi.metrics import collect, count, merge
+from dopi.extraction import (iter_pages, extract_image, extract_images, extraction_settings, IMAGE_EXTENSIONS,
+                             PDF_EXTENSIONS)
+from dopi.storage import BLOB_FOLDER, archive_file, is_blob_name, release_blob, stored_path
+
+# Number of documents written per transaction
+CHUNK_SIZE = 100
+# Tasks handed to the pool per worker before results are collected
+TASKS_PER_WORKER = 2
+# Images scanned by one Tesseract process
+IMAGE_BATCH = 8
+
+IngestResult = namedtuple("IngestResult", "imported total errors duplicates seconds")
+
+
+# All supported files below the folder, in a stable order. Folders that cannot be read are skipped, their errors
+# are added to errors.
+def find_files(folder, errors=None):
+    files = []
+    for directory, _, names in os.walk(folder, onerror=errors.append if errors is not None else None):
+        for name in names:
+            if os.path.splitext(name)[1].lower() in IMAGE_EXTENSIONS + PDF_EXTENSIONS:
+                files.append(os.path.join(directory, name))
+    return sorted(files)
+
+
+# Files of a storage folder that belong to documents: the files of the flat layout directly in the folder and the
+# blobs of the hashed layout. Subfolders like the preview cache (DOPI_previews) are not part of the archive.
+def find_stored_files(folder):
+    files = [entry.path for entry in os.scandir(folder)
+             if entry.is_file() and os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS + PDF_EXTENSIONS]
+    files += [path for path in find_files(os.path.join(folder, BLOB_FOLDER))
+              if is_blob_name(os.path.relpath(path, folder).replace(os.sep, "/"))]
+    return sorted(files)
+
+
+# Work packages for the pool: every PDF on its own, images in batches
+def make_tasks(files):
+    images = [path for path in files if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS]
+    tasks = [[path] for path in files if os.path.splitext(path)[1].lower() not in IMAGE_EXTENSIONS]
+    tasks += [images[i:i + IMAGE_BATCH] for i in range(0, len(images), IMAGE_BATCH)]
+    return tasks
+
+
+# Runs in a worker process: hash the files and extract their pages, the extraction cache is consulted first.
+# Returns [path, (sha256, pages) or None, error or None] for every file.
+# Images missing in the cache are scanned by one Tesseract process. The files are already spread over all
+# cores, so scanned PDF pages are not scanned in parallel here.
+def extract_files(paths, folder):
+    cache = ExtractionCache(Database(folder))
+    results, scans = [], []
+    for path in paths:
+        try:
+            digest = file_hash(path)
+            settings = extraction_settings(path)
+            if os.path.splitext(path)[1].lower() in IMAGE_EXTENSIONS:
+                pages = cache.get(cache_key(digest, settings))
+                if pages is None:
+                    scans.append(len(results))
+            else:
+                pages = [text for _, _, text in cache.pages(digest, settings,
+                                                            lambda: iter_pages(path, ocr_workers=1))]
+            results.append([path, (digest, pages), None])
+        except Exception as e:
+            results.append([path, None, e])
+    if scans:
+        try:
+            texts = extract_images([results[i][0] for i in scans])
+        except Exception:
+            # An unreadable image fails the whole batch, the images are scanned one by one to find it
+            texts = None
+        for n, i in enumerate(scans):
+            path, (digest, _), _ = results[i]
+            try:
+                text = texts[n] if texts is not None else extract_image(path)
+                cache.put(cache_key(digest, extraction_settings(path)), [text])
+                results[i][1] = (digest, [text])
+            except Exception as e:
+                results[i][1:] = [None, e]
+    return results
+
+
+# Extract the files on a process pool, yields [path, (sha256, pages) or None, error or None] as the files are done.
+# Only a bounded number of tasks is in flight, results are handled while the pool keeps working. A long running
+# caller can pass its own executor, otherwise a pool is started for the files. The measurements of the workers
+# (see dopi.metrics) come back with the results.
+def extract_parallel(files, folder, workers=None, executor=None):
+    workers = workers or os.cpu_count() or 1
+    if executor is None:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from extract_parallel(files, folder, workers, executor)
+        return
+    pending = iter(make_tasks(files))
+    futures = {}
+    for paths in pending:
+        futures[executor.submit(collect, extract_files, paths, folder)] = paths
+        if len(futures) >= workers * TASKS_PER_WORKER:
+            break
+    while futures:
+        finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in finished:
+            paths = futures.pop(future)
+            next_paths = next(pending, None)
+            if next_paths is not None:
+                futures[executor.submit(collect, extract_files, next_paths, folder)] = next_paths
+            try:
+                results, measurements = future.result()
+                merge(measurements)
+                yield from results
+            except Exception as e:
+                yield from ([path, None, e] for path in paths)
+
+
+# Archive the files into the storage folder of the database and store their text, named after the file. A file
+# whose name already exists replaces the file and text of that document, its keywords and date are kept.
+# progress(done, total, errors, files_per_second) is called after every file, on_file(path, sha256, error) with
+# the outcome of every file (sha256 is None if the file could not be read).
+def ingest_files(database, files, mode="Copy", workers=None, chunk_size=CHUNK_SIZE, progress=None, on_file=None,
+                 executor=None):
+    rows, errors, duplicates = [], [], []
+    # Blobs of replaced documents, removed once the chunk is written and no other document refers to them
+    replaced = []
+    # Claims on the archived blobs until their documents are written, see Database.claim_blob
+    claims = []
+    imported = done = 0
+    start = time.perf_counter()
+
+    def write():
+        nonlocal rows, replaced, claims, imported
+        database.upsert_many(rows, claims)
+        for blob in replaced:
+            release_blob(database, blob)
+        imported += len(rows)
+        rows, replaced, claims = [], [], []
+
+    for path, result, error in extract_parallel(files, database.folder, workers, executor):
+        digest = None
+        try:
+            if error is not None:
+                raise error
+            digest, pages = result
+            name = os.path.basename(path)
+            duplicate = database.find_by_hash(digest)
+            if duplicate is not None and duplicate != name:
+                duplicates.append((path, duplicate))
+            keyword1, keyword2, date, old_blob = database.metadata(name) or ("", "", "", None)
+            blob, digest = archive_file(path, database.folder, mode, digest,
+                                        claim=lambda blob: claims.append(database.claim_blob(blob)))
+            if old_blob not in (None, blob):
+                replaced.append(old_blob)
+            rows.append((name, keyword1, keyword2, date, pages, digest, blob))
+        except Exception as e:
+            error = e
+            errors.append((path, e))
+            count("ingest.errors")
+        count("ingest.files")
+        done += 1
+        if len(rows) >= chunk_size:
+            write()
+        if on_file:
+            on_file(path, digest, error)
+        if progress:
+            progress(done, len(files), len(errors), done / (time.perf_counter() - start))
+    if rows or claims:
+        write()
+    return IngestResult(imported, len(files), errors, duplicates, time.perf_counter() - start)
+
+
+# Import all supported files of the folder, see ingest_files
+def ingest_folder(database, folder, mode="Copy", workers=None, chunk_size=CHUNK_SIZE, progress=None):
+    return ingest_files(database, find_files(folder), mode, workers, chunk_size, progress)
+
+
+# Extract the text of all archived documents again, e.g. after the OCR profile was changed. Name, keywords and
+# date are kept, documents whose file is missing in the storage folder are reported as errors.
+def reindex_storage(database, workers=None, chunk_size=CHUNK_SIZE, progress=None):
+    # Documents by file, in the hashed storage layout several documents can share a file
+    documents = defaultdict(list)
+    for name, keyword1, keyword2, date, blob in database.all_details():
+        documents[stored_path(database.folder, name, blob)].append((name, keyword1, keyword2, date, blob))
+    files = [path for path in documents if os.path.isfile(path)]
+    errors = [(path, FileNotFoundError("Datei fehlt im Speicherpfad")) for path in documents if path not in files]
+    rows = []
+    imported = done = 0
+    start = time.perf_counter()
+    for path, result, error in extract_parallel(files, database.folder, workers):
+        if error is None:
+            digest, pages = result
+            rows.extend((name, keyword1, keyword2, date, pages, digest, blob)
+                        for name, keyword1, keyword2, date, blob in documents[path])
+        else:
+            errors.append((path, error))
+        done += 1
+        if len(rows) >= chunk_size:
+            database.upsert_many(rows)
+            imported += len(rows)
+            rows = []
+        if progress:
+            progress(done, len(files), len(errors), done / (time.perf_counter() - start))
+    if rows:
+        database.upsert_many(rows)
+        imported += len(rows)
+    return IngestResult(imported, sum(map(len, documents.values())), errors, [], time.perf_counter() - start)
+
+
+# Add a document for every stored file (see find_stored_files) that no document refers to, e.g. after DOPI.db
+# was lost. Files of the flat layout keep their name, blobs of the hashed layout are named after their file.
+# Keywords and date are empty, they are not stored with the files.
+def rebuild_catalogue(database, workers=None, chunk_size=CHUNK_SIZE, progress=None):
+    known = {os.path.normpath(stored_path(database.folder, name, blob))
+             for name, _, _, _, blob in database.all_details()}
+    files = [path for path in find_stored_files(database.folder) if os.path.normpath(path) not in known]
+    rows, errors, duplicates = [], [], []
+    imported = done = 0
+    start = time.perf_counter()
+    for path, result, error in extract_parallel(files, database.folder, workers):
+        relative = os.path.relpath(path, database.folder).replace(os.sep, "/")
+        blob = relative if relative.startswith(BLOB_FOLDER + "/") else None
+        name = os.path.basename(path)
+        if error is not None:
+            errors.append((path, error))
+        elif database.find_by_name(name) or name in (row[0] for row in rows):
+            # Stored under another path, the existing document is kept
+            duplicates.append((path, name))
+        else:
+            digest, pages = result
+            rows.append((name, "", "", "", pages, digest, blob))
+        done += 1
+        if len(rows) >= chunk_size:
+            database.upsert_many(rows)
+            imported += len(rows)
+            rows = []
+        if progress:
+            progress(done, len(files), len(errors), done / (time.perf_counter() - start))
+    if rows:
+        database.upsert_many(rows)
+        imported += len(rows)
+    return IngestResult(imported, len(files), errors, duplicates, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    from dopi.cli import main
+
+    sys.exit(main(["ingest"] + sys.argv[1:]))
@@ -0,0 +1,41 @@
+"""
+Background jobs for the GUI.
+
+A job consumes a generator on a worker thread and hands every item to the Tk thread via root.after, so long
+running work like OCR never blocks the main loop. Jobs can be cancelled between two items.
+"""
+
+import threading
+
+
+class BackgroundJob:
+    # items() is called on the worker thread, on_item(item) and on_done(cancelled, error) run on the Tk thread
+    def __init__(self, root, items, on_item, on_done):
+        self.root = root
+        self.on_item = on_item
+        self.on_done = on_done
+        self._cancelled = threading.Event()
+        threading.Thread(target=self._run, args=(items,), daemon=True).start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def _run(self, items):
+        error = None
+        try:
+            for item in items():
+                if self.cancelled:
+                    break
+                self.root.after(0, self._item, item)
+        except Exception as e:
+            error = e
+        self.root.after(0, self.on_done, self.cancelled, error)
+
+    def _item(self, item):
+        # Items that were already queued when the job was cancelled are dropped
+        if not self.cancelled:
+            self.on_item(item)
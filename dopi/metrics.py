@@ -0,0 +1,132 @@
+"""
+Lightweight instrumentation: timers and counters around the stages of scanning, importing and searching.
+
+Disabled by default, enabled with "Instrumentation": true in config.json; a disabled timer costs a single check.
+The last SAMPLES measurements of every stage are kept in memory for the statistics and every measurement is
+written to a rolling log file. Worker processes of the folder import do not write the log themselves, they hand
+their measurements back with the results (collect) and the main process records them (merge).
+"""
+
+import logging
+import logging.handlers
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+
+from dopi.config import load_config
+
+LOG_FILE = "DOPI_metrics.log"
+LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3
+# Measurements per stage used for the percentiles
+SAMPLES = 1000
+# Seconds over which the throughput is counted
+RATE_WINDOW = 60
+
+_enabled = None
+_lock = threading.Lock()
+# stage -> (time, seconds) of the last measurements, number of all measurements and counters
+_samples = defaultdict(lambda: deque(maxlen=SAMPLES))
+_totals = defaultdict(int)
+_counters = defaultdict(int)
+# Measurements of a worker process, handed back instead of being recorded
+_collected = None
+_logger = logging.getLogger("dopi.metrics")
+
+
+def enabled():
+    global _enabled
+    if _enabled is None:
+        _enabled = bool(load_config().get("Instrumentation", False))
+        if _enabled and not _logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(LOG_FILE, maxBytes=LOG_BYTES, backupCount=LOG_BACKUPS,
+                                                           encoding="utf-8", delay=True)
+            handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+            _logger.addHandler(handler)
+            _logger.setLevel(logging.INFO)
+            _logger.propagate = False
+    return _enabled
+
+
+def record(stage, seconds):
+    if not enabled():
+        return
+    if _collected is not None:
+        _collected.append(("time", stage, seconds))
+        return
+    with _lock:
+        _samples[stage].append((time.time(), seconds))
+        _totals[stage] += 1
+    _logger.info("%s %.3f ms", stage, seconds * 1000)
+
+
+def count(name, n=1):
+    if not enabled():
+        return
+    if _collected is not None:
+        _collected.append(("count", name, n))
+        return
+    with _lock:
+        _counters[name] += n
+    _logger.info("%s +%d", name, n)
+
+
+@contextmanager
+def timer(stage):
+    if not enabled():
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+# Decorator for functions and methods that are timed as a whole
+def timed(stage):
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+# Runs in a worker process: call the function and return its result together with the measurements
+def collect(function, *args):
+    global _collected
+    _collected = []
+    try:
+        return function(*args), _collected
+    finally:
+        _collected = None
+
+
+# Record the measurements of a worker process
+def merge(measurements):
+    for kind, name, value in measurements:
+        if kind == "time":
+            record(name, value)
+        else:
+            count(name, value)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+# Statistics as (stage, count, p50 ms, p95 ms, measurements per minute) and the counters as {name: value}
+def stats():
+    now = time.time()
+    rows = []
+    with _lock:
+        for stage in sorted(_samples):
+            durations = sorted(seconds * 1000 for _, seconds in _samples[stage])
+            recent = sum(1 for at, _ in _samples[stage] if now - at <= RATE_WINDOW)
+            rows.append((stage, _totals[stage], percentile(durations, 50), percentile(durations, 95),
+                         recent * 60 / RATE_WINDOW))
+        return rows, dict(_counters)
@@ -0,0 +1,100 @@
+"""
+OCR backends.
+
+Tesseract loads its language models every time it starts, which dominates the runtime for small images. The
+batch backend hands many images to a single Tesseract process through a list file. The per-call backend starts
+one process per image (pytesseract) and is the fallback when a batch fails.
+
+Backends provide image_to_string(paths, lang=None, config=""), returning the text of every image in order.
+pytesseract and Pillow are imported on first use.
+"""
+
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+from dopi.config import load_config
+from dopi.metrics import count, timer
+
+DEFAULT_BACKEND = "batch"
+# Reference to the local Tesseract directory (Windows build, an installed Tesseract is used on other systems)
+TESSERACT_CMD = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tesseract", "tesseract.exe")
+
+
+# pytesseract, set up for the bundled Tesseract
+def tesseract():
+    import pytesseract
+
+    if os.name == "nt" and os.path.exists(TESSERACT_CMD):
+        pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+    return pytesseract
+
+
+class PerCallBackend:
+    name = "per-call"
+
+    def image_to_string(self, paths, lang=None, config=""):
+        from PIL import Image
+
+        pytesseract = tesseract()
+        texts = []
+        for path in paths:
+            with Image.open(path) as image:
+                # Same as the batch output: without the form feed at the end of the page
+                with timer("ocr.tesseract"):
+                    texts.append(pytesseract.image_to_string(image, lang=lang, config=config).rstrip("\f"))
+        count("ocr.images", len(paths))
+        return texts
+
+
+class BatchBackend:
+    name = "batch"
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback or PerCallBackend()
+
+    def image_to_string(self, paths, lang=None, config=""):
+        try:
+            return self._run(paths, lang, config)
+        except (OSError, RuntimeError):
+            # A single unreadable image fails the whole batch, the fallback reports it per image
+            return self.fallback.image_to_string(paths, lang, config)
+
+    def _run(self, paths, lang, config):
+        pytesseract = tesseract()
+        with tempfile.TemporaryDirectory() as folder:
+            # Tesseract opens the files of the list itself and cannot handle every path on Windows,
+            # so the images are copied into the working directory under plain names
+            names = []
+            for i, path in enumerate(paths):
+                names.append(f"{i}{os.path.splitext(path)[1]}")
+                shutil.copyfile(path, os.path.join(folder, names[-1]))
+            with open(os.path.join(folder, "images.txt"), "w") as list_file:
+                list_file.write("\n".join(names) + "\n")
+            command = [pytesseract.pytesseract.tesseract_cmd, "images.txt", "output"]
+            if lang:
+                command += ["-l", lang]
+            command += shlex.split(config, posix=os.name != "nt") + ["txt"]
+            with timer("ocr.tesseract"):
+                process = subprocess.run(command, cwd=folder, **pytesseract.pytesseract.subprocess_args())
+            if process.returncode != 0:
+                raise RuntimeError(process.stderr.decode(errors="replace"))
+            with open(os.path.join(folder, "output.txt"), encoding="utf-8") as output:
+                text = output.read()
+        # Every page of the output ends with a form feed
+        texts = text.split("\f")
+        if len(texts) != len(paths) + 1:
+            raise RuntimeError(f"Tesseract lieferte {len(texts) - 1} statt {len(paths)} Seiten")
+        count("ocr.images", len(paths))
+        return texts[:-1]
+
+
+BACKENDS = {backend.name: backend for backend in (BatchBackend, PerCallBackend)}
+
+
+# Backend by name, by default the one configured in config.json ("OCR backend")
+def get_backend(name=None):
+    name = name or load_config().get("OCR backend", DEFAULT_BACKEND)
+    return BACKENDS.get(name, BACKENDS[DEFAULT_BACKEND])()
@@ -0,0 +1,262 @@
+"""
+Paged loading of the overview table and of long texts.
+
+Only the rows that are visible (plus a small reserve) are held in the treeview. The next page is fetched with
+keyset pagination when the scrollbar approaches the end, so loading time and memory do not grow with the archive.
+Long document texts are shown the same way: a capped part first, more while scrolling.
+"""
+
+import bisect
+import re
+from collections import deque
+
+PAGE_SIZE = 200
+# Fraction of the scroll range after which the next page is loaded
+PREFETCH_AT = 0.9
+
+
+class PagedTreeview:
+    def __init__(self, tree, scrollbar, page_size=PAGE_SIZE):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.page_size = page_size
+        self._fetch_page = None
+        self._background = False
+        self._source = None  # Identifies the current row source, pages of an older one are dropped
+        self._key = None
+        self._exhausted = True
+        self._loading = False
+        self._count = 0
+        self._items = {}  # First value of a row (the document id): treeview item
+        tree.configure(yscrollcommand=self._on_scroll)
+
+    # Replace the content with a new row source.
+    # fetch_page(key, limit) returns (rows, next_key), first_page is an already fetched result of fetch_page.
+    # A source that is read on another thread is loaded with background=True: fetch_page(key, limit, deliver)
+    # then only queues the query and deliver((rows, next_key)) is called later on the Tk thread.
+    def load(self, fetch_page, key, first_page=None, background=False):
+        self.clear()
+        self._fetch_page = fetch_page
+        self._background = background
+        if first_page is not None:
+            self._append(*first_page)
+        else:
+            self._key = key
+            self._exhausted = False
+            self._load_next_page()
+
+    # Remove all rows in a single call
+    def clear(self):
+        self.tree.delete(*self.tree.get_children())
+        self._fetch_page = None
+        self._source = object()
+        self._exhausted = True
+        self._loading = False
+        self._count = 0
+        self._items = {}
+
+    # Is the row with the id loaded
+    def contains(self, row_id):
+        return row_id in self._items
+
+    # Largest id of the loaded rows, 0 if there are none
+    def max_id(self):
+        return max(self._items, default=0)
+
+    # Replace the values of loaded rows and remove deleted ones, rows is {id: row or None}. Values beyond the
+    # length of the new row (the page of the first hit of a search) are kept.
+    def update_rows(self, rows):
+        changed = False
+        for row_id, row in rows.items():
+            item = self._items.get(row_id)
+            if item is None:
+                continue
+            if row is None:
+                self.tree.delete(item)
+                del self._items[row_id]
+                changed = True
+            else:
+                values = self.tree.item(item, "values")
+                self.tree.item(item, values=list(row) + list(values[len(row):]))
+        if changed:
+            self._restripe()
+
+    # Insert rows above the loaded rows
+    def prepend(self, rows):
+        for row in reversed(rows):
+            self._items[row[0]] = self.tree.insert("", 0, values=row)
+        if rows:
+            self._restripe()
+
+    def _restripe(self):
+        children = self.tree.get_children()
+        for index, item in enumerate(children):
+            self.tree.item(item, tags=("evenrow" if index % 2 == 0 else "oddrow",))
+        self._count = len(children)
+
+    def _append(self, rows, next_key):
+        for row in rows:
+            self._items[row[0]] = self.tree.insert("", "end", values=row,
+                                                   tags=("evenrow" if self._count % 2 == 0 else "oddrow",))
+            self._count += 1
+        self._key = next_key
+        self._exhausted = len(rows) < self.page_size
+
+    def _load_next_page(self):
+        if self._fetch_page is None or self._exhausted:
+            self._loading = False
+        elif self._background:
+            # Stays loading until the page arrives, the scroll callback does not queue it twice
+            self._loading = True
+            self._fetch_page(self._key, self.page_size,
+                             lambda page, source=self._source: self._deliver(source, page))
+        else:
+            self._loading = False
+            self._append(*self._fetch_page(self._key, self.page_size))
+
+    def _deliver(self, source, page):
+        if source is self._source:
+            self._loading = False
+            self._append(*page)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        if float(last) >= PREFETCH_AT and not self._exhausted and not self._loading:
+            # Not inside the scroll callback, the insertions would trigger it again
+            self._loading = True
+            self.tree.after_idle(self._load_next_page)
+
+
+# Characters of text shown at once, more is loaded while scrolling
+TEXT_CHUNK = 20000
+# Separator between two pages in a text widget
+PAGE_SEPARATOR = "\n" * 2
+
+
+class LazyText:
+    # widget is a tk.Text, on_append(start, text) is called with the index and the text of every insertion.
+    # Every page starts at a mark, so the pages of an editable text can be read back after the user changed them.
+    def __init__(self, widget, scrollbar_set, read_only=False, chunk=TEXT_CHUNK, on_append=None):
+        self.widget = widget
+        self.scrollbar_set = scrollbar_set
+        self.read_only = read_only
+        self.chunk = chunk
+        self.on_append = on_append
+        self._pages = deque()
+        self._source = None
+        self._count = 0
+        self._shown = 0
+        self._limit = chunk
+        widget.configure(yscrollcommand=self._on_scroll)
+
+    # Show the prefix and the pages, pages is an iterator that is only read as far as needed
+    def load(self, pages, prefix=""):
+        self.clear()
+        self._insert(prefix)
+        self._source = iter(pages)
+        self._fill()
+
+    # Add a page, it is shown immediately as long as the shown text is below the limit
+    def append(self, text):
+        self._pages.append(text)
+        self._fill()
+
+    def clear(self):
+        self.widget.configure(state="normal")
+        self.widget.delete("1.0", "end")
+        if self.read_only:
+            self.widget.configure(state="disabled")
+        self.widget.edit_modified(False)
+        for page_index in range(self._count):
+            self.widget.mark_unset(f"page{page_index}")
+        self._pages.clear()
+        self._source = None
+        self._count = 0
+        self._shown = 0
+        self._limit = self.chunk
+
+    # Show the next chunk without waiting for the scrollbar
+    def load_more(self):
+        self._limit = self._shown + self.chunk
+        self._fill()
+
+    @property
+    def has_more(self):
+        return bool(self._pages) or self._source is not None
+
+    # Did the user change the text
+    @property
+    def edited(self):
+        return bool(self.widget.edit_modified())
+
+    # Texts of all pages as currently shown, with the changes of the user. The pages that are not shown yet are
+    # loaded first.
+    def page_texts(self):
+        self._limit = float("inf")
+        self._fill()
+        if not self._count:
+            # Typed into an empty box
+            text = self.widget.get("1.0", "end-1c")
+            return [text] if text.strip() else []
+        texts = []
+        for page_index in range(self._count):
+            end = f"page{page_index + 1}" if page_index + 1 < self._count else "end-1c"
+            texts.append(self.widget.get(f"page{page_index}", end).removesuffix(PAGE_SEPARATOR))
+        return texts
+
+    def _next_page(self):
+        if self._pages:
+            return self._pages.popleft()
+        if self._source is not None:
+            text = next(self._source, None)
+            if text is not None:
+                return text
+            self._source = None
+        return None
+
+    # Insert at the end, the modified flag only tracks the changes of the user
+    def _insert(self, text):
+        start = self.widget.index("end-1c")
+        modified = self.widget.edit_modified()
+        self.widget.configure(state="normal")
+        self.widget.insert("end", text)
+        if self.read_only:
+            self.widget.configure(state="disabled")
+        self.widget.edit_modified(modified)
+        if self.on_append:
+            self.on_append(start, text)
+
+    def _fill(self):
+        while self._shown < self._limit:
+            text = self._next_page()
+            if text is None:
+                break
+            # Pages are separated by an empty line
+            if self._count:
+                self._insert(PAGE_SEPARATOR)
+                self._shown += len(PAGE_SEPARATOR)
+            # Text typed at the start of a page belongs to that page
+            mark = f"page{self._count}"
+            self.widget.mark_set(mark, "end-1c")
+            self.widget.mark_gravity(mark, "left")
+            self._insert(text)
+            self._count += 1
+            self._shown += len(text)
+
+    def _on_scroll(self, first, last):
+        self.scrollbar_set(first, last)
+        if float(last) >= PREFETCH_AT and self._shown >= self._limit and self.has_more:
+            self._limit = self._shown + self.chunk
+            self.widget.after_idle(self._fill)
+
+
+# Text widget indices ("line.column") of character offsets in a text inserted at start, in one pass over the
+# line breaks instead of one index calculation by Tk per offset
+def text_indices(start, text, offsets):
+    line, column = map(int, start.split("."))
+    newlines = [match.start() for match in re.finditer("\n", text)]
+    indices = []
+    for offset in offsets:
+        row = bisect.bisect_left(newlines, offset)
+        indices.append(f"{line}.{column + offset}" if row == 0 else f"{line + row}.{offset - newlines[row - 1] - 1}")
+    return indices
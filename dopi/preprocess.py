@@ -0,0 +1,150 @@
+"""
+Image preprocessing before OCR.
+
+Scans are rotated according to their EXIF orientation, converted to grayscale, scaled down to a maximum
+resolution and optionally binarized and cropped to their content. Named profiles choose these steps together
+with the Tesseract engine mode, page segmentation mode and language.
+
+Pillow is imported on first use.
+
+Usage: python -m dopi.preprocess IMAGE [--profile NAME]  (shows the time of every stage)
+"""
+
+import argparse
+import time
+
+from dopi.config import load_config
+from dopi.metrics import record
+
+# Resolution assumed for images without DPI information: the long side is an A4 page (11.69 inch)
+A4_LONG_SIDE = 11.69
+# Screen resolutions that cameras and phones write as a default, they say nothing about the scanned page
+SCREEN_DPI = 96
+# Pixels darker than this count as content when cropping the borders
+CONTENT_THRESHOLD = 200
+CROP_MARGIN = 10
+
+PROFILES = {
+    "fast": {"max_dpi": 200, "binarize": True, "crop": True, "lang": "deu", "config": "--oem 1 --psm 6"},
+    "balanced": {"max_dpi": 300, "binarize": False, "crop": True, "lang": "deu+eng", "config": "--oem 1 --psm 3"},
+    "accurate": {"max_dpi": 400, "binarize": False, "crop": False, "lang": "deu+eng", "config": "--oem 1 --psm 3"},
+}
+DEFAULT_PROFILE = "balanced"
+
+
+# Profile name, by default the one configured in config.json ("OCR profile")
+def profile_name(name=None):
+    name = name or load_config().get("OCR profile", DEFAULT_PROFILE)
+    return name if name in PROFILES else DEFAULT_PROFILE
+
+
+# Resolution of the image, estimated from its size if the file does not contain it. A screen resolution of an
+# image larger than an A4 page at that resolution (a phone photo tagged 72 dpi) is estimated as well.
+def image_dpi(image):
+    dpi = image.info.get("dpi")
+    if dpi and dpi[0] > 1 and (dpi[0] > SCREEN_DPI or max(image.size) / dpi[0] <= A4_LONG_SIDE):
+        return float(dpi[0])
+    return max(image.size) / A4_LONG_SIDE
+
+
+# Threshold between foreground and background with Otsu's method
+def otsu_threshold(image):
+    histogram = image.histogram()
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = weight_background = 0
+    best, threshold = 0, 127
+    for i, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += i * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best:
+            best, threshold = variance, i
+    return threshold
+
+
+# Run the stages of the profile, returns the prepared image, its resolution and the seconds per stage
+def preprocess(image, profile):
+    from PIL import Image, ImageOps
+
+    timings = {}
+
+    def stage(name, function, *args):
+        start = time.perf_counter()
+        result = function(*args)
+        timings[name] = time.perf_counter() - start
+        return result
+
+    dpi = image_dpi(image)
+    image = stage("exif", ImageOps.exif_transpose, image)
+    image = stage("grayscale", lambda i: i.convert("L"), image)
+    if dpi > profile["max_dpi"]:
+        scale = profile["max_dpi"] / dpi
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = stage("downscale", lambda i: i.resize(size, Image.Resampling.BILINEAR, reducing_gap=2.0), image)
+        dpi = profile["max_dpi"]
+    if profile["crop"]:
+        def crop(i):
+            box = i.point(lambda v: 255 if v < CONTENT_THRESHOLD else 0).getbbox()
+            if box is None:
+                return i
+            return i.crop((max(0, box[0] - CROP_MARGIN), max(0, box[1] - CROP_MARGIN),
+                           min(i.width, box[2] + CROP_MARGIN), min(i.height, box[3] + CROP_MARGIN)))
+        image = stage("crop", crop, image)
+    if profile["binarize"]:
+        def binarize(i):
+            threshold = otsu_threshold(i)
+            return i.point(lambda v: 255 if v > threshold else 0, "1")
+        image = stage("binarize", binarize, image)
+    return image, dpi, timings
+
+
+# Prepare the image file for OCR and save it as PNG, returns the seconds per stage
+def prepare_image(path, target, profile):
+    from PIL import Image
+
+    timings = {}
+    start = time.perf_counter()
+    with Image.open(path) as image:
+        image.load()
+        timings["open"] = time.perf_counter() - start
+        image, dpi, stage_timings = preprocess(image, profile)
+    timings.update(stage_timings)
+    start = time.perf_counter()
+    image.save(target, "PNG", dpi=(dpi, dpi), compress_level=1)
+    timings["save"] = time.perf_counter() - start
+    for stage, seconds in timings.items():
+        record(f"preprocess.{stage}", seconds)
+    return timings
+
+
+def main(argv=None):
+    import os
+    import tempfile
+    from dopi.extraction import extract_images
+
+    parser = argparse.ArgumentParser(prog="python -m dopi.preprocess",
+                                     description="Vorverarbeitung und OCR eines Bildes mit Zeitmessung je Stufe.")
+    parser.add_argument("image")
+    parser.add_argument("--profile", choices=sorted(PROFILES), help="OCR-Profil (Standard: aus config.json)")
+    args = parser.parse_args(argv)
+    name = profile_name(args.profile)
+    with tempfile.TemporaryDirectory() as folder:
+        timings = prepare_image(args.image, os.path.join(folder, "prepared.png"), PROFILES[name])
+    for stage, seconds in timings.items():
+        print(f"{stage:10} {seconds * 1000:9.1f} ms")
+    for label, profile in (("ohne Vorverarbeitung", None), (name, name)):
+        start = time.perf_counter()
+        extract_images([args.image], profile, preprocessing=profile is not None)
+        print(f"OCR {label}: {time.perf_counter() - start:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
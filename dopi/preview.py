@@ -0,0 +1,169 @@
+"""
+Previews of the archived files for the popup of the overview.
+
+Images are scaled down with Pillow's thumbnail, PDF files show the largest embedded image of their first page
+(scanned documents, a PDF with only a text layer has no preview). Previews are rendered on a background thread and
+stored as PNG in DOPI_previews next to DOPI.db, keyed by the SHA-256 of the file (by path, size and modification
+time if it is unknown). The last previews are also kept in memory, limited in bytes, so a preview that was shown
+before appears at once. Pillow and pypdf are imported on first use.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+from dopi.extraction import PDF_EXTENSIONS, page_images
+from dopi.metrics import count, timer
+
+PREVIEW_FOLDER = "DOPI_previews"
+# Largest width and height of a preview
+PREVIEW_SIZE = (260, 360)
+MEMORY_BYTES = 32 * 1024 * 1024
+DISK_BYTES = 256 * 1024 * 1024
+# Previews written between two checks of the size of the disk cache
+EVICT_EVERY = 100
+
+
+# Cache key of a file: its SHA-256 or, if it is unknown, its path, size and modification time
+def preview_key(path, sha256=None):
+    if not sha256:
+        stat = os.stat(path)
+        sha256 = hashlib.sha256(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()
+    return f"{sha256}-{PREVIEW_SIZE[0]}x{PREVIEW_SIZE[1]}"
+
+
+# Downscaled image of the file, None if there is nothing to show
+def render_preview(path):
+    from PIL import Image, ImageOps
+
+    if os.path.splitext(path)[1].lower() in PDF_EXTENSIONS:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        images = page_images(reader.pages[0]) if len(reader.pages) else []
+        if not images:
+            return None
+        image = max((Image.open(BytesIO(data)) for _, data in images), key=lambda image: image.width * image.height)
+    else:
+        image = Image.open(path)
+        # JPEG files are decoded at a reduced size right away
+        image.draft("RGB", PREVIEW_SIZE)
+        image = ImageOps.exif_transpose(image)
+    image.thumbnail(PREVIEW_SIZE)
+    return image if image.mode in ("RGB", "L") else image.convert("RGB")
+
+
+class PreviewCache:
+    def __init__(self, root, database, memory_bytes=MEMORY_BYTES, disk_bytes=DISK_BYTES):
+        self.root = root  # Tk widget used to get back to the main thread
+        self.database = database  # The previews are stored in the storage folder of the database
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key: image or None (no preview)
+        self._memory_size = 0
+        self._condition = threading.Condition()
+        self._pending = OrderedDict()  # key: (path, callbacks), the newest request is served first
+        self._written = 0
+        threading.Thread(target=self._work, daemon=True).start()
+
+    # Call callback(image) on the Tk thread with the preview of the file, image is None if there is none. A preview
+    # in memory is handed over at once, everything else is read or rendered by the worker.
+    def request(self, path, sha256, callback):
+        try:
+            key = preview_key(path, sha256)
+        except OSError:
+            callback(None)
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                image = self._memory[key]
+                count("preview.memory_hit")
+                callback(image)
+                return
+        with self._condition:
+            callbacks = self._pending.pop(key, (path, []))[1]
+            self._pending[key] = (path, callbacks + [callback])
+            self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                key, (path, callbacks) = self._pending.popitem()
+            try:
+                image = self._load(key, path)
+            except Exception:
+                # Missing or unreadable file, nothing is cached
+                image = None
+            for callback in callbacks:
+                self.root.after(0, callback, image)
+
+    # Preview from the disk cache or rendered and stored there. An empty file stands for "no preview".
+    def _load(self, key, path):
+        from PIL import Image
+
+        cache_path = os.path.join(self.database.folder, PREVIEW_FOLDER, key + ".png")
+        try:
+            with open(cache_path, "rb") as cache_file:
+                data = cache_file.read()
+            # The least recently used previews are evicted first
+            os.utime(cache_path)
+            count("preview.disk_hit")
+            image = Image.open(BytesIO(data)) if data else None
+            if image is not None:
+                image.load()
+        except FileNotFoundError:
+            count("preview.render")
+            with timer("preview.render"):
+                image = render_preview(path)
+            self._store(cache_path, image)
+        self._remember(key, image)
+        return image
+
+    def _remember(self, key, image):
+        with self._lock:
+            self._memory[key] = image
+            self._memory_size += image.width * image.height * len(image.getbands()) if image else 0
+            while self._memory_size > self.memory_bytes and len(self._memory) > 1:
+                _, old = self._memory.popitem(last=False)
+                self._memory_size -= old.width * old.height * len(old.getbands()) if old else 0
+
+    # Write the preview atomically, a half written file is never read
+    def _store(self, cache_path, image):
+        folder = os.path.dirname(cache_path)
+        os.makedirs(folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+        try:
+            with os.fdopen(fd, "wb") as temp_file:
+                if image is not None:
+                    image.save(temp_file, "PNG")
+            os.replace(temp_path, cache_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+        self._written += 1
+        if self._written % EVICT_EVERY == 0:
+            self._evict(folder)
+
+    # Remove the least recently used previews until the disk cache fits into its limit again
+    def _evict(self, folder):
+        files = []
+        for entry in os.scandir(folder):
+            if entry.name.endswith(".png"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
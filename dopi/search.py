@@ -0,0 +1,304 @@
+"""
+Search engine for the overview tab.
+
+Queries run on a worker thread with its own database connection. Input is debounced, a query that is overtaken
+by a newer keystroke is interrupted and only the result set of the latest search is handed back to the Tk thread.
+Further result pages are read on the same worker while the list is scrolled.
+Result pages are kept in a small LRU cache until the documents change.
+"""
+
+import re
+import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+
+from dopi.metrics import count
+
+# Columns as displayed in the overview, followed by the page number of the first hit ('' if there is none, Tk
+# would show None as text). The page texts are never read for the list, the snippet is stored with the document.
+LIST_COLUMNS = "documents.id, name, keyword1, keyword2, date, snippet"
+
+# Every term has to match the metadata or any page of a document. The score of a term is its best bm25 score
+# (name and keywords weigh more than the content), the scores of all terms are added. Best matches first,
+# paged by (score, id).
+TERM_HITS = '''
+    SELECT rowid AS document_id, {term} AS term, bm25(documents_fts, 10.0, 5.0, 5.0, 2.0) AS score, NULL AS page_no
+    FROM documents_fts WHERE documents_fts MATCH ?
+    UNION ALL
+    SELECT pages.document_id, {term}, bm25(pages_fts), pages.page_no
+    FROM pages_fts JOIN pages ON pages.id = pages_fts.rowid WHERE pages_fts MATCH ?
+    '''
+SEARCH_QUERY = '''
+    WITH hits AS ({hits}),
+    matches AS (
+        SELECT document_id, sum(score) AS score, min(page_no) AS page_no FROM (
+            SELECT document_id, min(score) AS score, min(page_no) AS page_no FROM hits GROUP BY document_id, term)
+        GROUP BY document_id HAVING count(*) = ?)
+    SELECT {columns}, ifnull(matches.page_no, ''), matches.score FROM matches
+    JOIN documents ON documents.id = matches.document_id
+    WHERE {conditions}(matches.score > ? OR (matches.score = ? AND documents.id < ?))
+    ORDER BY matches.score, documents.id DESC
+    LIMIT ?
+    '''
+
+# Key of the first page
+FIRST_PAGE = (float("-inf"), 2 ** 63 - 1)
+
+# Overview without search terms, newest first or by the document date. Paged by (iso_date, id), documents
+# without a valid date come last in the date order.
+LIST_QUERY = '''
+    SELECT {columns}, '', iso_date FROM documents
+    WHERE {conditions}
+    ORDER BY {order}
+    LIMIT ?
+    '''
+LIST_ORDERS = {
+    "id": ("documents.id < ?", "documents.id DESC"),
+    "date": ("iso_date <= ? AND (iso_date < ? OR documents.id < ?)", "iso_date DESC, documents.id DESC"),
+}
+FIRST_LIST_KEY = ("~", 2 ** 63 - 1)
+
+# Filters of the overview: date range as ISO dates (None for an open end), exact keyword (None for all) and
+# the order of the list without search terms ("id" or "date")
+Filters = namedtuple("Filters", "date_from date_to keyword order", defaults=(None, None, None, "id"))
+NO_FILTERS = Filters()
+
+# Number of result pages kept by the query cache
+QUERY_CACHE_SIZE = 128
+
+
+# Full-text query of a term: a prefix query, so that the search works while typing
+def fts_query(term):
+    return '"' + term.replace('"', '""') + '"*'
+
+
+# Pattern for all search terms: like the full-text search a term matches the beginning of a word, case-insensitive
+@lru_cache(maxsize=32)
+def terms_pattern(search_terms):
+    alternatives = "|".join(re.escape(term) for term in sorted(search_terms, key=len, reverse=True))
+    return re.compile(rf"(?<!\w)(?:{alternatives})\w*", re.IGNORECASE)
+
+
+# Positions of the words matching any of the search terms as (start, end), in a single pass over the text
+def match_ranges(text, search_terms):
+    if not search_terms:
+        return []
+    return [match.span() for match in terms_pattern(tuple(search_terms)).finditer(text)]
+
+
+# Conditions of the filters and their parameters. A date range is an index range scan on iso_date, a keyword
+# one on (keyword1, iso_date) and (keyword2, iso_date).
+def filter_conditions(filters):
+    conditions, parameters = [], []
+    if filters.date_from or filters.date_to:
+        # An empty iso_date (no valid date) is outside of every range
+        conditions.append("iso_date BETWEEN ? AND ?")
+        parameters.extend([filters.date_from or "0000-01-01", filters.date_to or "9999-12-31"])
+    if filters.keyword is not None:
+        conditions.append("(keyword1 = ? OR keyword2 = ?)")
+        parameters.extend([filters.keyword] * 2)
+    return conditions, parameters
+
+
+# Query one page of the overview without search terms after the given (iso_date, id) key
+def list_page(connection, key, limit, filters=NO_FILTERS):
+    after, order = LIST_ORDERS[filters.order]
+    conditions, parameters = filter_conditions(filters)
+    parameters.extend([key[1]] if filters.order == "id" else [key[0], key[0], key[1]])
+    query = LIST_QUERY.format(columns=LIST_COLUMNS, conditions=" AND ".join(conditions + [after]), order=order)
+    data = connection.execute(query, parameters + [limit]).fetchall()
+    if not data:
+        return [], key
+    return [row[:-1] for row in data], (data[-1][-1], data[-1][0])
+
+
+# Query one page of search results after the given (score, id) key.
+# The last column is the page of the first hit in the content ('' for hits in name, keywords or date).
+def search_page(connection, search_terms, key, limit, filters=NO_FILTERS):
+    score, last_id = key
+    conditions, filter_parameters = filter_conditions(filters)
+    query = SEARCH_QUERY.format(hits=" UNION ALL ".join(TERM_HITS.format(term=i) for i in range(len(search_terms))),
+                                columns=LIST_COLUMNS,
+                                conditions="".join(f"{condition} AND " for condition in conditions))
+    parameters = []
+    for term in search_terms:
+        parameters.extend([fts_query(term)] * 2)
+    cursor = connection.cursor()
+    cursor.execute(query, parameters + [len(search_terms)] + filter_parameters + [score, score, last_id, limit])
+    data = cursor.fetchall()
+    if not data:
+        return [], key
+    return [row[:-1] for row in data], (data[-1][-1], data[-1][0])
+
+
+# Search terms as cache key: the full-text search ignores case, the order of the terms and repeated terms
+def normalize_terms(search_terms):
+    return tuple(sorted({term.lower() for term in search_terms}))
+
+
+# Does the term contain a token of the full-text index. unicode61 splits at everything but letters and digits, a
+# term without them (e.g. "(" or "#") matches no document, although a longer term starting with it may.
+def has_token(term):
+    return re.search(r"[^\W_]", term) is not None
+
+
+# Term lists that match at least every document the search terms match: one term left out or shortened to a prefix
+# that still contains a token
+def broader_terms(search_terms):
+    for i, term in enumerate(search_terms):
+        rest = search_terms[:i] + search_terms[i + 1:]
+        if rest:
+            yield rest
+        for length in range(len(term) - 1, 0, -1):
+            if not has_token(term[:length]):
+                break
+            yield normalize_terms(rest + (term[:length],))
+
+
+class QueryCache:
+    def __init__(self, size=QUERY_CACHE_SIZE):
+        self.size = size
+        self.generation = 0  # Bumped whenever documents change, entries of older generations are stale
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # (search terms, filters, key, limit): (generation, page)
+        self._lock = threading.Lock()
+
+    # Called after every committed change of the documents
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+
+    # One page of search results like search_page, from the cache if possible
+    def search_page(self, connection, search_terms, key, limit, filters=NO_FILTERS):
+        search_terms = normalize_terms(search_terms)
+        page, generation = self._lookup(search_terms, filters, key, limit)
+        if page is None:
+            page = search_page(connection, search_terms, key, limit, filters)
+            self._store((search_terms, filters, key, limit), generation, page)
+        return page
+
+    def _lookup(self, search_terms, filters, key, limit):
+        with self._lock:
+            page = self._get((search_terms, filters, key, limit))
+            # Typing on narrows the search: if a broader search found nothing, this one cannot find anything either
+            if page is None and key == FIRST_PAGE and any(self._get((broader, filters, key, limit)) == ([], key)
+                                                          for broader in broader_terms(search_terms)):
+                page = [], key
+                self._put((search_terms, filters, key, limit), self.generation, page)
+            if page is None:
+                self.misses += 1
+                count("search.cache_miss")
+            else:
+                self.hits += 1
+                count("search.cache_hit")
+            return page, self.generation
+
+    def _store(self, cache_key, generation, page):
+        with self._lock:
+            # A result read before a change is not stored as current
+            if generation == self.generation:
+                self._put(cache_key, generation, page)
+
+    def _get(self, cache_key):
+        entry = self._entries.get(cache_key)
+        if entry is None:
+            return None
+        if entry[0] != self.generation:
+            del self._entries[cache_key]
+            return None
+        self._entries.move_to_end(cache_key)
+        return entry[1]
+
+    def _put(self, cache_key, generation, page):
+        self._entries[cache_key] = generation, page
+        self._entries.move_to_end(cache_key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+
+class SearchEngine:
+    def __init__(self, root, on_results, database, page_size, delay=250):
+        self.root = root  # Tk widget used to get back to the main thread
+        self.on_results = on_results  # Called with the search terms, filters and first page of the latest search
+        self.database = database  # dopi.database.Database, the worker thread gets its own connection
+        self.page_size = page_size
+        self.delay = delay / 1000
+        self._condition = threading.Condition()
+        self._generation = 0
+        self._pending = None
+        self._pending_page = None
+        self._running = None
+        threading.Thread(target=self._work, daemon=True).start()
+
+    # Queue a search, every older search becomes stale
+    def submit(self, search, filters=NO_FILTERS):
+        with self._condition:
+            self._generation += 1
+            search_terms = search.split()
+            self._pending = (self._generation, search_terms, filters, FIRST_PAGE, self.page_size,
+                             lambda page: self.on_results(search_terms, filters, page))
+            self._interrupt()
+            self._condition.notify()
+
+    # Queue the next page of the latest search, deliver(page) is called on the Tk thread unless a newer search was
+    # started in the meantime. Pages are fetched without delay and do not interrupt a running query.
+    def fetch_page(self, search_terms, filters, key, limit, deliver):
+        with self._condition:
+            self._pending_page = (self._generation, search_terms, filters, key, limit, deliver)
+            self._condition.notify()
+
+    # Drop pending and running searches without starting a new one
+    def cancel(self):
+        with self._condition:
+            self._generation += 1
+            self._pending = None
+            self._pending_page = None
+            self._interrupt()
+
+    def _interrupt(self):
+        if self._running is not None:
+            self._running.interrupt()
+
+    # Wait for a request: a requested page at once, a search once no newer keystroke arrived within the delay
+    def _next_request(self):
+        with self._condition:
+            while True:
+                while self._pending is None and self._pending_page is None:
+                    self._condition.wait()
+                if self._pending_page is not None:
+                    request, self._pending_page = self._pending_page, None
+                    return request
+                request = self._pending
+                self._condition.wait(self.delay)
+                if self._pending is request:
+                    self._pending = None
+                    return request
+
+    def _work(self):
+        while True:
+            generation, search_terms, filters, key, limit, deliver = self._next_request()
+            try:
+                connection = self.database.connection()
+            except sqlite3.Error:
+                continue
+            with self._condition:
+                if generation != self._generation:
+                    continue
+                self._running = connection
+            try:
+                page = self.database.query_cache.search_page(connection, search_terms, key, limit, filters)
+            except sqlite3.Error:
+                # Interrupted by a newer search or no usable database
+                page = [], key
+            finally:
+                with self._condition:
+                    self._running = None
+            if generation == self._generation:
+                self.root.after(0, self._deliver, generation, deliver, page)
+
+    # Runs on the Tk thread, a newer search may have been started in the meantime
+    def _deliver(self, generation, deliver, page):
+        if generation == self._generation:
+            deliver(page)
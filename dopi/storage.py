@@ -0,0 +1,254 @@
+"""
+File storage: archiving of the scanned files in the storage folder.
+
+Two layouts are supported, chosen with "Storage layout" in config.json:
+- flat (default): every file is stored under its name directly in the storage folder.
+- hashed: files are stored by content as blobs/ab/cd/<sha256><extension>. Files with the same name no longer
+  replace each other, identical files are stored once and no folder holds more than a few hundred entries.
+  The database maps the document name to its blob, a blob is removed when no document refers to it anymore.
+
+migrate_to_hashed converts an existing flat archive (python -m dopi migrate-storage), verify_archive compares the
+stored files with the checksums in the database (python -m dopi verify).
+"""
+
+import contextlib
+import errno
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+
+from dopi.cache import file_hash
+from dopi.config import load_config, save_config
+from dopi.database import write_transaction
+from dopi.metrics import timer
+
+BLOB_FOLDER = "blobs"
+# blobs/ab/cd/abcd...<extension>, the folders are the first characters of the SHA-256
+BLOB_PATTERN = re.compile(rf"{BLOB_FOLDER}/([0-9a-f]{{2}})/([0-9a-f]{{2}})/\1\2[0-9a-f]{{60}}(\.[a-z0-9]+)?")
+COPY_CHUNK = 1024 * 1024
+LAYOUTS = ("flat", "hashed")
+
+
+def storage_layout():
+    layout = load_config().get("Storage layout", "flat")
+    return layout if layout in LAYOUTS else "flat"
+
+
+# Path of a blob relative to the storage folder, with forward slashes so that the database works on every system
+def blob_name(sha256, name):
+    return "/".join([BLOB_FOLDER, sha256[:2], sha256[2:4], sha256 + os.path.splitext(name)[1].lower()])
+
+
+# Is the text a blob path as written by blob_name, for paths from outside like an imported catalogue
+def is_blob_name(blob):
+    return BLOB_PATTERN.fullmatch(blob) is not None
+
+
+# Path of a stored document, blob is None for documents in the flat layout
+def stored_path(target_folder, name, blob=None):
+    return os.path.join(target_folder, blob or name)
+
+
+# Copy between open files in the kernel where possible: copy_file_range (Linux, can use reflinks or a server-side
+# copy on network file systems), then sendfile, otherwise in chunks. A method that is not supported for the files
+# fails or stops early (some file systems report 0 bytes copied), the next one continues at the current position.
+# Raises OSError if the target does not get the size of the source.
+def copy_fast(source_file, target_file):
+    size = os.fstat(source_file.fileno()).st_size
+    remaining = size
+    for copy in (getattr(os, "copy_file_range", None), _sendfile if hasattr(os, "sendfile") else None):
+        if copy is None:
+            continue
+        try:
+            while remaining > 0:
+                copied = copy(source_file.fileno(), target_file.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            pass
+        if remaining <= 0:
+            break
+    if remaining > 0:
+        shutil.copyfileobj(source_file, target_file, COPY_CHUNK)
+    target_file.flush()
+    written = os.fstat(target_file.fileno()).st_size
+    if written != size:
+        raise OSError(errno.EIO, f"Unvollständige Kopie: {written} von {size} Bytes")
+
+
+def _sendfile(source_fd, target_fd, count):
+    return os.sendfile(target_fd, source_fd, None, count)
+
+
+# Write the source into a temporary file in the folder with a single read: the SHA-256 is computed on the way,
+# or the kernel copies the data if the checksum is already known. The known checksum is then checked against the
+# written file, which is still in the page cache, so the recorded checksum is always the one of the stored bytes.
+# Returns (temporary path, sha256) once the data is on disk.
+def _write_temp(source, folder, sha256=None):
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+    known = sha256 is not None
+    try:
+        with open(source, "rb") as source_file, os.fdopen(fd, "wb") as target_file:
+            if not known:
+                size = os.fstat(source_file.fileno()).st_size
+                digest = hashlib.sha256()
+                while chunk := source_file.read(COPY_CHUNK):
+                    digest.update(chunk)
+                    target_file.write(chunk)
+                sha256 = digest.hexdigest()
+                target_file.flush()
+                if os.fstat(target_file.fileno()).st_size != size:
+                    raise OSError(errno.EIO, "Die Datei wurde während des Kopierens geändert")
+            else:
+                copy_fast(source_file, target_file)
+            target_file.flush()
+            os.fsync(target_file.fileno())
+        if known and file_hash(temp_path) != sha256:
+            raise OSError(errno.EIO, "Die Prüfsumme der Kopie weicht ab, die Datei wurde seit dem Scan geändert")
+        shutil.copymode(source, temp_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+    return temp_path, sha256
+
+
+# Make a rename in the folder durable. Not needed on Windows, where folders cannot be opened for fsync. Some file
+# systems (network shares, FUSE) do not support fsync of a folder, the rename has happened anyway.
+def _sync_folder(folder):
+    if os.name == "nt":
+        return
+    fd = os.open(folder, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        if e.errno not in (errno.EINVAL, errno.ENOTSUP, errno.EBADF):
+            raise
+    finally:
+        os.close(fd)
+
+
+# Rename into place atomically, readers see the old file or the complete new one
+def _place(temp_path, target_path):
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    os.replace(temp_path, target_path)
+    _sync_folder(os.path.dirname(target_path))
+
+
+# Move the source into a temporary file in the folder. Returns (temporary path, sha256, copied): the checksum is the
+# one of the moved bytes, a checksum taken earlier (at the scan) may be stale. Across file systems the source is
+# copied, copied is then True and the caller removes the source once the copy is in place.
+def _move_temp(source, folder):
+    fd, temp_path = tempfile.mkstemp(suffix=".tmp", dir=folder)
+    os.close(fd)
+    try:
+        os.replace(source, temp_path)
+    except OSError as e:
+        os.remove(temp_path)
+        if e.errno != errno.EXDEV:
+            raise
+        return (*_write_temp(source, folder), True)
+    return temp_path, file_hash(temp_path), False
+
+
+# Copy or move the file into the storage folder. The source is read once: a copy computes the SHA-256 while
+# writing (or runs in the kernel if the checksum is known, then the copy is checked against it), a move within the
+# same file system is a rename followed by the checksum of the moved file.
+# Nothing is renamed into place before it is on disk, so the storage never holds a partial file.
+# An existing file is replaced in the flat layout, in the hashed layout an existing blob already has the same
+# content and is kept. Returns (blob, sha256), the blob is None in the flat layout.
+# The document referring to the blob is saved later. claim(blob) is called before the blob is looked for (see
+# Database.claim_blob): a blob that another document releases in the meantime is either still claimed or already
+# gone and written again.
+def archive_file(source, target_folder, mode="Copy", sha256=None, layout=None, claim=None):
+    hashed = (layout or storage_layout()) == "hashed"
+    name = os.path.basename(source)
+    with timer(f"archive.{mode.lower()}"):
+        blob = blob_name(sha256, name) if hashed and sha256 and mode != "Move" else None
+        if blob and claim:
+            claim(blob)
+        # A blob with the known checksum is only reused if the source still has that content
+        if blob and os.path.exists(os.path.join(target_folder, blob)) and file_hash(source) == sha256:
+            return blob, sha256
+        temp_folder = os.path.join(target_folder, BLOB_FOLDER) if hashed else target_folder
+        os.makedirs(temp_folder, exist_ok=True)
+        copied = False
+        if mode == "Move":
+            temp_path, sha256, copied = _move_temp(source, temp_folder)
+        else:
+            temp_path, sha256 = _write_temp(source, temp_folder, sha256)
+        if not hashed:
+            _place(temp_path, os.path.join(target_folder, name))
+            blob = None
+        else:
+            if blob is None:
+                # The checksum was computed while writing or moving
+                blob = blob_name(sha256, name)
+                if claim:
+                    claim(blob)
+            if os.path.exists(os.path.join(target_folder, blob)):
+                os.remove(temp_path)
+            else:
+                _place(temp_path, os.path.join(target_folder, blob))
+        if copied:
+            os.remove(source)
+        return blob, sha256
+
+
+# Remove a blob that no document refers to anymore. References are counted and the file is removed while the write
+# lock is held, so no claim (see archive_file) is committed in between.
+def release_blob(database, blob):
+    if not blob:
+        return
+
+    def remove(connection):
+        if not database.blob_references(blob):
+            try:
+                os.remove(os.path.join(database.folder, blob))
+            except FileNotFoundError:
+                pass
+    write_transaction(database.connection(), remove)
+
+
+# Move the files of a flat archive into the hashed layout and switch the layout in config.json.
+# Every document is committed on its own, an interrupted run can simply be started again.
+# progress(done, total) is called after every document. Returns the names of documents without a file.
+def migrate_to_hashed(database, progress=None):
+    documents = database.flat_documents()
+    missing = []
+    for done, (document_id, name, sha256) in enumerate(documents, start=1):
+        source = os.path.join(database.folder, name)
+        if os.path.isfile(source):
+            claims = []
+            blob, sha256 = archive_file(source, database.folder, "Move", layout="hashed",
+                                        claim=lambda blob: claims.append(database.claim_blob(blob)))
+            database.set_blob(document_id, blob, sha256, claims)
+        elif sha256 and os.path.isfile(os.path.join(database.folder, blob_name(sha256, name))):
+            # Moved by an interrupted run
+            database.set_blob(document_id, blob_name(sha256, name), sha256)
+        else:
+            missing.append(name)
+        if progress:
+            progress(done, len(documents))
+    save_config(**{"Storage layout": "hashed"})
+    return missing
+
+
+# Compare the stored files with their checksums, returns (name, problem) for every document that does not match.
+# Documents stored before checksums were recorded are not checked. progress(done, total) is called after every
+# document.
+def verify_archive(database, progress=None):
+    documents = database.stored_files()
+    problems = []
+    for done, (name, blob, sha256) in enumerate(documents, start=1):
+        path = stored_path(database.folder, name, blob)
+        if not os.path.isfile(path):
+            problems.append((name, "Datei fehlt"))
+        elif sha256 and file_hash(path) != sha256:
+            problems.append((name, "Prüfsumme weicht ab"))
+        if progress:
+            progress(done, len(documents))
+    return problems
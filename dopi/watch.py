@@ -0,0 +1,120 @@
+"""
+Watch mode: inbox folders are polled and new or changed files are imported automatically.
+
+Polling works the same on local disks and network shares. Every imported file is recorded in the inbox_files
+table as (path, size, mtime, sha256), so after a restart only files that are new or changed since then are
+imported. Files that failed (locked, share unavailable, OCR error) are not recorded and are tried again after a
+growing pause, or right away once they change. A file whose size or modification time changed but whose content
+did not is only recorded again. An inbox folder that cannot be read (share offline) is skipped, the rows of its
+files are kept until it can be read completely again.
+Files are imported like a folder import (archived and stored under their file name) on a process pool that
+lives as long as the watcher; at most MAX_FILES files are queued per round.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from dopi.cache import file_hash
+from dopi.ingest import find_files, ingest_files
+
+# Seconds between two scans of the inbox folders
+POLL_INTERVAL = 5
+# Files modified more recently may still be written by the scanner and are left for the next round
+SETTLE_SECONDS = 2
+# Files imported per round, the next round starts right away if more are waiting
+MAX_FILES = 500
+# Seconds before a failed file is tried again, doubled with every further failure up to RETRY_MAX
+RETRY_SECONDS = 60
+RETRY_MAX = 3600
+
+
+class Watcher:
+    def __init__(self, database, folders, mode="Copy", workers=None, interval=POLL_INTERVAL, log=print):
+        self.database = database
+        self.folders = [os.path.abspath(folder) for folder in folders]
+        self.mode = mode
+        self.workers = workers or os.cpu_count() or 1
+        self.interval = interval
+        self.log = log
+        self._failed = {}  # Path of a failed file: (failures, size, mtime_ns, time of the next try)
+        self._unreachable = set()  # Inbox folders that could not be read in the last round
+
+    # Files of the inbox folders that have to be imported as {path: (size, mtime_ns)}. Files that are unchanged
+    # apart from size or mtime are recorded right away, files that are gone are forgotten.
+    def changes(self):
+        state = self.database.inbox_state()
+        seen, changed, touched = set(), {}, []
+        now = time.time_ns()
+        scanned = []
+        for folder in self.folders:
+            errors = []
+            # An unreachable share would look empty, all of its files would be forgotten and imported again later
+            files = find_files(folder, errors) if os.path.isdir(folder) else None
+            if files is None or errors:
+                if folder not in self._unreachable:
+                    self._unreachable.add(folder)
+                    self.log(f"Ordner nicht lesbar: {folder}: {errors[0] if errors else 'nicht gefunden'}")
+            else:
+                self._unreachable.discard(folder)
+                scanned.append(folder)
+            for path in files or ():
+                seen.add(path)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                known = state.get(path)
+                if known is not None and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                    continue
+                if now - stat.st_mtime_ns < SETTLE_SECONDS * 1e9:
+                    continue
+                failed = self._failed.get(path)
+                if failed is not None and failed[1:3] == (stat.st_size, stat.st_mtime_ns) and now < failed[3]:
+                    continue
+                if known is not None and known[2] is not None and file_hash(path) == known[2]:
+                    touched.append((path, stat.st_size, stat.st_mtime_ns, known[2]))
+                else:
+                    changed[path] = (stat.st_size, stat.st_mtime_ns)
+        removed = [path for path in state if path not in seen
+                   and any(path.startswith(os.path.join(folder, "")) for folder in scanned)]
+        self._failed = {path: failed for path, failed in self._failed.items() if path in seen}
+        if touched or removed:
+            self.database.update_inbox_state(touched, removed)
+        return changed
+
+    # Import the waiting files, returns True if more files are waiting
+    def poll(self, executor):
+        changed = self.changes()
+        files = sorted(changed)[:MAX_FILES]
+        if not files:
+            return False
+        rows = []
+
+        def on_file(path, digest, error):
+            if error is None:
+                rows.append((path, *changed[path], digest))
+                self._failed.pop(path, None)
+                self.log(f"Importiert: {path}")
+            else:
+                failures = self._failed.get(path, (0,))[0] + 1
+                pause = min(RETRY_SECONDS * 2 ** (failures - 1), RETRY_MAX)
+                self._failed[path] = (failures, *changed[path], time.time_ns() + pause * 10 ** 9)
+                self.log(f"Fehler: {path}: {error} (neuer Versuch in {pause} s)")
+
+        result = ingest_files(self.database, files, self.mode, self.workers, on_file=on_file, executor=executor)
+        # Moved files are gone from the inbox, their rows are removed in the next round
+        self.database.update_inbox_state(rows)
+        for path, duplicate in result.duplicates:
+            self.log(f"Duplikat: {path} hat denselben Inhalt wie '{duplicate}'")
+        return len(changed) > len(files)
+
+    # Watch until the stop event is set
+    def run(self, stop=None):
+        stop = stop or threading.Event()
+        self.log(f"Überwache {', '.join(self.folders)}")
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            while not stop.is_set():
+                if not self.poll(executor):
+                    stop.wait(self.interval)
@@ -0,0 +1,19 @@
+"""
+Tests of the catalogue import of dopi.catalogue.
+"""
+
+import pytest
+
+from dopi.catalogue import document_row
+
+
+@pytest.mark.parametrize("name", ["", ".", "..", "../rechnung.pdf", "a/rechnung.pdf", "a\\rechnung.pdf",
+                                  "/rechnung.pdf", "C:rechnung.pdf", "C:\\rechnung.pdf", "rechnung.pdf:stream",
+                                  "\\\\server\\share\\rechnung.pdf"])
+def test_path_names_are_rejected(name):
+    with pytest.raises(ValueError):
+        document_row({"name": name})
+
+
+def test_plain_name_is_accepted():
+    assert document_row({"name": "Rechnung 4711.pdf", "pages": ["Seite"]})[0] == "Rechnung 4711.pdf"
@@ -0,0 +1,16 @@
+"""
+Tests of the OCR of embedded PDF images in dopi.extraction.
+"""
+
+from dopi import extraction
+
+
+# One broken image must not cost the text of the other images of the PDF
+def test_broken_image_gives_empty_text(monkeypatch):
+    def extract_images(paths, profile=None, preprocessing=True):
+        if "kaputt.png" in paths:
+            raise OSError("cannot identify image file")
+        return [f"Text {path}" for path in paths]
+
+    monkeypatch.setattr(extraction, "extract_images", extract_images)
+    assert extraction.extract_embedded_images(["a.png", "kaputt.png", "b.png"]) == ["Text a.png", "", "Text b.png"]
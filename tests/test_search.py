@@ -0,0 +1,74 @@
+"""
+Tests of the query cache of dopi.search.
+"""
+
+import threading
+
+import pytest
+
+from dopi.database import Database
+from dopi.search import FIRST_PAGE, QueryCache, broader_terms, search_page
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path))
+    database.create()
+    database.upsert("rechnung.pdf", "Rechnung", "", "01.02.2024", ["Bestellung 4711 vom Januar"])
+    database.upsert("vertrag.pdf", "Vertrag", "", "", ["Mietvertrag #12 Wohnung"])
+    yield database
+    database.close()
+
+
+def names(page):
+    return [row[1] for row in page[0]]
+
+
+def test_cached_page_is_returned_until_invalidated(database):
+    cache = QueryCache()
+    connection = database.connection()
+    assert names(cache.search_page(connection, ["rechnung"], FIRST_PAGE, 10)) == ["rechnung.pdf"]
+    assert names(cache.search_page(connection, ["RECHNUNG"], FIRST_PAGE, 10)) == ["rechnung.pdf"]
+    assert (cache.hits, cache.misses) == (1, 1)
+    cache.invalidate()
+    cache.search_page(connection, ["rechnung"], FIRST_PAGE, 10)
+    assert cache.misses == 2
+
+
+def test_empty_broader_search_narrows_without_query(database):
+    cache = QueryCache()
+    connection = database.connection()
+    assert names(cache.search_page(connection, ["xyz"], FIRST_PAGE, 10)) == []
+    assert names(cache.search_page(connection, ["xyzw"], FIRST_PAGE, 10)) == []
+    assert names(cache.search_page(connection, ["xyz", "rechnung"], FIRST_PAGE, 10)) == []
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+# A prefix without a token matches nothing, the longer term can still match: typing "(4711" after "(" was empty
+@pytest.mark.parametrize("typed", [["(", "(4", "(47", "(4711"], ["#", "#1", "#12"], ["-", "-47"], ['"', '"47']])
+def test_prefix_without_token_does_not_narrow(database, typed):
+    for term in typed:
+        page = database.search_page([term], FIRST_PAGE, 10)
+    assert names(page) == names(search_page(database.connection(), [typed[-1]], FIRST_PAGE, 10))
+    assert names(page) != []
+
+
+def test_broader_terms_skip_prefixes_without_token():
+    assert list(broader_terms(("(47",))) == [("(4",)]
+    assert list(broader_terms(("ab", "c"))) == [("c",), ("a", "c"), ("ab",)]
+
+
+# Worker threads (search, keyword counts, imports) open their own connection, that must not empty the cache
+def test_new_thread_connection_keeps_cache(database, tmp_path):
+    database.search_page(["rechnung"], FIRST_PAGE, 10)
+    generation = database.query_cache.generation
+    thread = threading.Thread(target=database.keyword_counts)
+    thread.start()
+    thread.join()
+    assert database.query_cache.generation == generation
+    database.search_page(["rechnung"], FIRST_PAGE, 10)
+    assert database.query_cache.hits == 1
+    (tmp_path / "other").mkdir()
+    database.folder = str(tmp_path / "other")
+    database.connection()
+    assert database.query_cache.generation == generation + 1
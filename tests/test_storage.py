@@ -0,0 +1,40 @@
+"""
+Tests of archiving into the hashed storage of dopi.storage.
+"""
+
+import hashlib
+
+import pytest
+
+from dopi.storage import archive_file, blob_name
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# The checksum of the scan is stale when the file changed since then: a move is stored under the moved content
+def test_move_names_blob_after_moved_content(tmp_path):
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"neu")
+    archive = tmp_path / "archiv"
+    archive.mkdir()
+    blob, digest = archive_file(str(source), str(archive), "Move", sha256(b"alt"), layout="hashed")
+    assert (blob, digest) == (blob_name(sha256(b"neu"), "scan.pdf"), sha256(b"neu"))
+    assert (archive / blob).read_bytes() == b"neu"
+    assert not source.exists()
+
+
+# An existing blob with the stale checksum is not reused, the copy is refused
+def test_copy_does_not_reuse_blob_of_stale_checksum(tmp_path):
+    archive = tmp_path / "archiv"
+    archive.mkdir()
+    old = tmp_path / "alt.pdf"
+    old.write_bytes(b"alt")
+    blob = archive_file(str(old), str(archive), "Copy", layout="hashed")[0]
+    source = tmp_path / "scan.pdf"
+    source.write_bytes(b"neu")
+    with pytest.raises(OSError):
+        archive_file(str(source), str(archive), "Copy", sha256(b"alt"), layout="hashed")
+    assert (archive / blob).read_bytes() == b"alt"
+    assert [path.name for path in (archive / "blobs").rglob("*.tmp")] == []
@@ -0,0 +1,34 @@
+"""
+Tests of the inbox watcher of dopi.watch.
+"""
+
+import os
+
+import pytest
+
+from dopi.database import Database
+from dopi.watch import Watcher
+
+
+@pytest.fixture
+def database(tmp_path):
+    database = Database(str(tmp_path / "archiv"))
+    os.makedirs(database.folder)
+    database.create()
+    yield database
+    database.close()
+
+
+# A share that is offline looks like an empty folder, its files must not be forgotten
+def test_unreachable_folder_keeps_rows(database, tmp_path):
+    inbox = tmp_path / "inbox"
+    path = str(inbox / "scan.pdf")
+    database.update_inbox_state([(path, 10, 1, "0" * 64)])
+    messages = []
+    watcher = Watcher(database, [str(inbox)], log=messages.append)
+    assert watcher.changes() == {}
+    assert path in database.inbox_state()
+    assert len(messages) == 1
+    inbox.mkdir()
+    assert watcher.changes() == {}
+    assert path not in database.inbox_state()